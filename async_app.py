@@ -0,0 +1,304 @@
+"""ASGI front end serving the same routes as web_app.py on asyncio.
+
+Run it with ``hypercorn async_app:app --bind 0.0.0.0:5000``. MJPEG and
+event streams are async generators fed by the shared capture and event
+buffers, recognition jobs are awaited on the process pool, and check-ins
+go through web_app's local write-behind queue. Cameras, faces, the
+recognition pool and the report cache are the ones set up by web_app, so
+both front ends behave the same.
+"""
+import asyncio
+
+from pymongo.errors import PyMongoError
+from quart import Quart, render_template, request, jsonify, Response, redirect, url_for
+
+import attendance_events
+import enrolment
+import frame_source
+import metrics
+import mjpeg
+import reports as attendance_reports
+import repository
+import web_app
+from detection import config_for
+from recognition_service import BrokenProcessPool
+
+app = Quart(__name__)
+app.config["RESPONSE_TIMEOUT"] = None  # Video and event streams stay open until the viewer leaves
+
+async_repository = repository.AsyncRepository()
+
+async def run_blocking(fn, *args):
+    """Run a blocking call on the default thread pool."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+async def iterate_blocking(iterator):
+    """Pull items from a blocking iterator on the thread pool, one at a time."""
+    iterator = iter(iterator)
+    done = object()
+    while True:
+        item = await run_blocking(next, iterator, done)
+        if item is done:
+            break
+        yield item
+
+async def read_frame():
+    """Return the newest frame from the selected camera, or None."""
+    worker = web_app.camera
+    frame = worker.latest() if worker is not None and worker.is_opened else None
+    if frame is None:
+        # Opening the device or waiting for its first frame blocks
+        frame = await run_blocking(web_app.read_frame)
+    return frame
+
+async def recognize(frame):
+    """Return (face_locations, face_encodings); raises asyncio.TimeoutError or BrokenProcessPool."""
+    future = web_app.recognition_service.submit(frame, config_for(web_app.selected_camera_url))
+    return await asyncio.wait_for(asyncio.wrap_future(future), web_app.RECOGNITION_TIMEOUT)
+
+@app.after_serving
+async def shutdown():
+    await run_blocking(web_app.checkin_queue.stop)
+    await run_blocking(web_app.recognition_service.shutdown)
+    async_repository.close()
+
+@app.errorhandler(PyMongoError)
+async def database_unavailable(e):
+    return jsonify({"status": "error", "message": "The attendance database is unreachable. Please try again later."}), 503
+
+@app.route("/")
+async def home():
+    await run_blocking(web_app.release_camera)
+    return await render_template("home.html")
+
+@app.route("/select_camera", methods=["POST"])
+async def select_camera():
+    form = await request.form
+    cam_type = form.get("camera_type")
+    rtsp_url = form.get("rtsp_url")
+
+    if cam_type == "webcam":
+        web_app.selected_camera_url = 0
+    elif cam_type == "rtsp" and rtsp_url:
+        web_app.selected_camera_url = rtsp_url
+    else:
+        return "Invalid camera selection", 400
+
+    await run_blocking(web_app.release_camera)
+    if await run_blocking(web_app.get_camera) is None:
+        return "Failed to initialize selected camera", 500
+
+    return redirect(url_for("register"))
+
+@app.route("/video_feed")
+async def video_feed():
+    source = web_app.registered_cameras.get(request.args.get("camera"), web_app.selected_camera_url)
+    broadcaster = await run_blocking(mjpeg.subscribe, source, web_app.MJPEG_QUALITY, web_app.MJPEG_MAX_WIDTH)
+    if broadcaster is None:
+        return "Failed to initialize selected camera", 500
+
+    max_fps = request.args.get("fps", type=float) or web_app.MJPEG_MAX_FPS
+    if web_app.MJPEG_MAX_FPS:
+        max_fps = min(max_fps, web_app.MJPEG_MAX_FPS)
+
+    return Response(broadcaster.aframes(max_fps), mimetype="multipart/x-mixed-replace; boundary=frame")
+
+@app.route("/register", methods=["GET", "POST"])
+async def register():
+    if request.method == "GET":
+        await run_blocking(web_app.get_camera)
+        return await render_template("register.html")
+
+    try:
+        form = await request.form
+        name = form.get("name")
+        phone = form.get("phone")
+
+        if not name or not phone:
+            return jsonify({"status": "error", "message": "Name and phone are required."}), 400
+        if not web_app.recognition_service.is_ready:
+            return jsonify({"status": "error", "message": web_app.STARTING_MESSAGE}), 503
+
+        frames = await run_blocking(web_app.read_burst)
+        if not frames:
+            return jsonify({"status": "error", "message": "Failed to access webcam."}), 500
+
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(asyncio.wrap_future(web_app.recognition_service.submit(
+                    frame, config_for(web_app.selected_camera_url))) for frame in frames)),
+                web_app.RECOGNITION_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            return jsonify({"status": "error", "message": "Face recognition timed out. Please try again."}), 503
+        except BrokenProcessPool:
+            return jsonify({"status": "error", "message": web_app.RESTARTING_MESSAGE}), 503
+
+        face_encodings, photo, reason = enrolment.pick_samples(frames, results)
+        if not face_encodings:
+            return jsonify({"status": "error", "message": reason}), 400
+
+        await run_blocking(web_app.enroll_faces, name, photo, face_encodings)
+        await async_repository.register_person(
+            name, phone, camera_id=web_app.camera_id_for(web_app.selected_camera_url)
+        )
+        web_app.report_cache.invalidate()
+
+        return jsonify({"status": "success", "message": f"{name} registered successfully!"})
+    except Exception as e:
+        return jsonify({"status": "error", "message": "An internal error occurred."}), 500
+
+@app.route("/enrol", methods=["GET", "POST"])
+async def enrol():
+    if request.method == "GET":
+        return jsonify(web_app.enrolment_status)
+    form = await request.form
+    status, message, code = web_app.start_enrolment(form.get("source"), form.get("images"))
+    return jsonify({"status": status, "message": message}), code
+
+@app.route("/mark_attendance", methods=["GET", "POST"])
+async def mark_attendance():
+    if request.method == "GET":
+        await run_blocking(web_app.get_camera)
+        return await render_template("mark_attendance.html", hands_free=web_app.recognition_loop is not None)
+    with metrics.timed("mark_attendance"):
+        return await recognize_and_mark()
+
+async def recognize_and_mark():
+    if not web_app.recognition_service.is_ready:
+        return jsonify({"status": "error", "message": web_app.STARTING_MESSAGE}), 503
+    frame = await read_frame()
+    if frame is None:
+        return jsonify({"status": "error", "message": "Failed to access webcam."}), 500
+
+    try:
+        face_locations, face_encodings = await recognize(frame)
+    except asyncio.TimeoutError:
+        return jsonify({"status": "error", "message": "Face recognition timed out. Please try again."}), 503
+    except BrokenProcessPool:
+        return jsonify({"status": "error", "message": web_app.RESTARTING_MESSAGE}), 503
+
+    # Pick up faces enrolled by other workers since the last request
+    with metrics.timed("face_store_sync"):
+        await run_blocking(web_app.face_store.sync, web_app.face_index)
+    with metrics.timed("match"):
+        matches = web_app.face_index.match(face_encodings)
+    for name, distance in matches:
+        if name is not None:
+            # A local queue write; MongoDB is updated by web_app's background flusher
+            status, message = await run_blocking(
+                web_app.mark_present, name, web_app.camera_id_for(web_app.selected_camera_url)
+            )
+            return jsonify({"status": status, "message": message})
+
+    return jsonify({"status": "error", "message": "No recognized faces found."})
+
+@app.route("/recognition/start", methods=["POST"])
+async def start_recognition():
+    status, message, code = await run_blocking(web_app.start_hands_free)
+    return jsonify({"status": status, "message": message}), code
+
+@app.route("/recognition/stop", methods=["POST"])
+async def stop_recognition():
+    await run_blocking(web_app.stop_hands_free)
+    return jsonify({"status": "success", "message": "Hands-free recognition stopped."})
+
+@app.route("/cameras", methods=["GET", "POST"])
+async def cameras():
+    if request.method == "GET":
+        return jsonify({camera_id: str(source) for camera_id, source in web_app.registered_cameras.items()})
+
+    form = await request.form
+    status, message, code = await run_blocking(web_app.add_camera, form.get("camera_id"), form.get("source"))
+    return jsonify({"status": status, "message": message}), code
+
+@app.route("/cameras/stats")
+async def camera_stats():
+    return jsonify(frame_source.stats())
+
+@app.route("/cameras/<camera_id>", methods=["DELETE"])
+async def remove_camera(camera_id):
+    status, message, code = await run_blocking(web_app.drop_camera, camera_id)
+    return jsonify({"status": status, "message": message}), code
+
+@app.route("/recognition/events")
+async def recognition_event_stream():
+    return Response(web_app.recognition_events.astream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
+
+@app.route("/mark_absentees", methods=["POST"])
+async def mark_absentees():
+    summary = await run_blocking(repository.close_out_day)
+    web_app.report_cache.invalidate()
+    return jsonify({
+        "status": "success",
+        "message": f"Absentees marked successfully: {summary['absent_marked']} of {summary['people']} people "
+                   f"in {summary['elapsed_ms']} ms.",
+        **summary,
+    })
+
+@app.route("/reports")
+async def reports():
+    await run_blocking(web_app.release_camera)
+
+    params = web_app.report_params(request.args)
+    cached = web_app.report_cache.get(params)
+    if cached is None:
+        cached = await async_repository.report_page(*params)
+        web_app.report_cache.put(params, cached)
+    return await render_template("reports.html", **web_app.report_context(params, *cached))
+
+@app.route("/reports/export")
+async def export_report():
+    day = web_app.report_day(request.args).strftime(attendance_events.DAY_FORMAT)
+    rows = await run_blocking(repository.iter_report, day)  # get_db() may create indexes
+    if request.args.get("format") == "json":
+        return Response(iterate_blocking(attendance_reports.export_json(rows)), mimetype="application/json")
+    return Response(
+        iterate_blocking(attendance_reports.export_csv(rows)), mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=attendance-{day}.csv"}
+    )
+
+@app.route("/analytics/daily")
+async def daily_analytics():
+    try:
+        start, end = web_app.analytics_range(request.args)
+        return jsonify(await run_blocking(repository.daily_range, start, end))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Dates must be YYYY-MM-DD."}), 400
+
+@app.route("/analytics/person/<name>")
+async def person_analytics(name):
+    try:
+        start, end = web_app.analytics_range(request.args)
+        return jsonify(await run_blocking(repository.person_range, name, start, end))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Dates must be YYYY-MM-DD."}), 400
+
+@app.route("/ready")
+async def ready():
+    body, code = web_app.readiness()
+    return jsonify(body), code
+
+@app.route("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route("/metrics/profiler", methods=["GET", "POST"])
+async def profiler():
+    if request.method == "GET":
+        return Response(metrics.profiler.collapsed(), mimetype="text/plain")
+    form = await request.form
+    action = form.get("action")
+    if action == "start":
+        metrics.profiler.start(form.get("interval", type=float))
+    elif action == "stop":
+        await run_blocking(metrics.profiler.stop)
+    elif action == "reset":
+        metrics.profiler.reset()
+    else:
+        return jsonify({"status": "error", "message": "action must be start, stop or reset."}), 400
+    return jsonify({"status": "success", "running": metrics.profiler.is_running})
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,249 @@
+import time
+from datetime import datetime
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import rollups
+
+PEOPLE_COLLECTION = "attendance"  # One document per person: name, phone
+EVENTS_COLLECTION = "attendance_events"  # One document per person per day
+DAY_FORMAT = "%Y-%m-%d"
+TIME_FORMAT = "%H:%M:%S"
+
+# Date formats written by older versions into the embedded attendance arrays
+LEGACY_DATE_FORMATS = ["%d-%m-%Y %H:%M:%S", "%d-%m-%Y", "%d-%m-%y %H:%M", "%Y-%m-%d"]
+
+
+# (collection, keys, options) of every index the attendance collections rely on
+INDEXES = [
+    (PEOPLE_COLLECTION, [("name", ASCENDING)], {"unique": True}),
+    (EVENTS_COLLECTION, [("name", ASCENDING), ("day", ASCENDING)], {"unique": True}),
+    (EVENTS_COLLECTION, [("day", ASCENDING), ("status", ASCENDING)], {}),
+] + rollups.INDEXES
+
+
+def ensure_indexes(db):
+    for collection, keys, options in INDEXES:
+        db[collection].create_index(keys, **options)
+
+
+def present_upsert(name, when=None, camera_id=None, latitude=None, longitude=None):
+    """Build the ``(day, filter, update)`` that marks ``name`` present.
+
+    Shared by mark_present and mark_present_many so both run the same query.
+    """
+    when = when or datetime.now()
+    event = {
+        "status": "present",
+        "time": when.strftime(TIME_FORMAT),
+        "marked_at": when,
+        "camera_id": camera_id,
+        "latitude": latitude,
+        "longitude": longitude,
+    }
+    day = when.strftime(DAY_FORMAT)
+    return day, {"name": name, "day": day, "status": {"$ne": "present"}}, {"$set": event}
+
+
+def mark_present(db, name, when=None, camera_id=None, latitude=None, longitude=None):
+    """Mark ``name`` present for the day of ``when``.
+
+    Returns True if this call marked them, False if they were already marked
+    present that day. A single indexed upsert: an earlier non-present event
+    for the day (e.g. absent) is overwritten, while an existing
+    present event makes the upsert collide with the unique (name, day) index.
+    """
+    day, query, update = present_upsert(name, when, camera_id, latitude, longitude)
+    try:
+        previous = db[EVENTS_COLLECTION].find_one_and_update(
+            query,
+            update,
+            projection={"_id": 0, "status": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:
+        return False
+    rollups.apply_change(db, name, day, previous and previous.get("status"), "present", update["$set"]["time"])
+    return True
+
+
+def mark_present_many(db, checkins):
+    """Bulk version of mark_present for check-ins replayed from a local queue.
+
+    ``checkins`` are ``(name, when, camera_id, latitude, longitude)`` tuples
+    with distinct (name, day) pairs. One unordered bulk upsert writes them
+    all; people already present that day collide with the unique index and
+    are skipped, so replaying a batch is harmless. Returns the number newly
+    marked. Errors other than those collisions are raised after the rollups
+    for the successful writes have been applied.
+    """
+    upserts = [present_upsert(*checkin) for checkin in checkins]
+    if not upserts:
+        return 0
+    previous = {
+        (event["name"], event["day"]): event.get("status")
+        for event in db[EVENTS_COLLECTION].find(
+            {"$or": [{"name": query["name"], "day": day} for day, query, _ in upserts]},
+            {"_id": 0, "name": 1, "day": 1, "status": 1},
+        )
+    }
+    failed, error = set(), None
+    try:
+        db[EVENTS_COLLECTION].bulk_write([UpdateOne(query, update, upsert=True) for _, query, update in upserts],
+                                         ordered=False)
+    except BulkWriteError as e:
+        failed = {write_error["index"] for write_error in e.details["writeErrors"]}
+        if any(write_error["code"] != 11000 for write_error in e.details["writeErrors"]):
+            error = e
+
+    changes = [
+        (query["name"], day, previous.get((query["name"], day)), "present", update["$set"]["time"])
+        for index, (day, query, update) in enumerate(upserts)
+        if index not in failed and previous.get((query["name"], day)) != "present"
+    ]
+    rollups.apply_changes(db, changes)
+    if error is not None:
+        raise error
+    return len(changes)
+
+
+def record_status(db, name, day, status, **fields):
+    """Record a non-present status (e.g. absent) unless the day already has an event."""
+    result = db[EVENTS_COLLECTION].update_one(
+        {"name": name, "day": day},
+        {"$setOnInsert": {"status": status, **fields}},
+        upsert=True,
+    )
+    if result.upserted_id is not None:
+        rollups.apply_change(db, name, day, None, status)
+
+
+def close_out_day(db, day=None, batch_size=1000):
+    """Mark everyone without an event on ``day`` as absent.
+
+    Absentees are an indexed set difference (all people minus the names with
+    an event that day), written with unordered ``$setOnInsert`` upserts in
+    a few bulk_write calls, so re-running it is harmless. Returns counts and
+    the elapsed time.
+    """
+    started = time.perf_counter()
+    day = day or datetime.now().strftime(DAY_FORMAT)
+
+    people = {person["name"] for person in db[PEOPLE_COLLECTION].find({}, {"_id": 0, "name": 1}) if "name" in person}
+    recorded = set(db[EVENTS_COLLECTION].distinct("name", {"day": day}))
+    absentees = sorted(people - recorded)
+
+    marked = 0
+    for start in range(0, len(absentees), batch_size):
+        batch = absentees[start:start + batch_size]
+        operations = [
+            UpdateOne({"name": name, "day": day}, {"$setOnInsert": {"status": "absent"}}, upsert=True)
+            for name in batch
+        ]
+        result = db[EVENTS_COLLECTION].bulk_write(operations, ordered=False)
+        # Only count the absences this run actually inserted
+        rollups.apply_absences(db, day, [batch[i] for i in result.upserted_ids])
+        marked += result.upserted_count
+
+    return {
+        "day": day,
+        "people": len(people),
+        "already_recorded": len(people & recorded),
+        "absent_marked": marked,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def person_upsert(name, phone, when=None, camera_id=None):
+    """Build the ``(filter, update)`` that creates or updates a person.
+
+    A ``phone`` of None never overwrites a phone number already on record.
+    """
+    when = when or datetime.now()
+    on_insert = {"registered_at": when, "registered_camera_id": camera_id}
+    if phone is None:
+        return {"name": name}, {"$setOnInsert": {"phone": None, **on_insert}}
+    return {"name": name}, {"$set": {"phone": phone}, "$setOnInsert": on_insert}
+
+
+def register_person(db, name, phone, when=None, camera_id=None):
+    """Create or update the person document; returns True if it is new."""
+    query, update = person_upsert(name, phone, when, camera_id)
+    result = db[PEOPLE_COLLECTION].update_one(query, update, upsert=True)
+    return result.upserted_id is not None
+
+
+def register_people(db, people, when=None, camera_id=None, batch_size=1000):
+    """Create or update many ``(name, phone)`` people with unordered bulk upserts.
+
+    Returns the number of new people.
+    """
+    created = 0
+    operations = [UpdateOne(*person_upsert(name, phone, when, camera_id), upsert=True) for name, phone in people]
+    for start in range(0, len(operations), batch_size):
+        created += db[PEOPLE_COLLECTION].bulk_write(operations[start:start + batch_size], ordered=False).upserted_count
+    return created
+
+
+def parse_legacy_date(value):
+    """Parse a date string from the embedded arrays; returns a datetime or None."""
+    if isinstance(value, datetime):
+        return value
+    for fmt in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def backfill(db, batch_size=1000):
+    """Copy embedded ``attendance`` arrays into the events collection.
+
+    Safe to re-run: events are upserted with ``$setOnInsert``, and a present
+    entry wins over any other status recorded for the same day.
+    """
+    people = db[PEOPLE_COLLECTION]
+    events = db[EVENTS_COLLECTION]
+    written = skipped = 0
+    operations = []
+
+    for record in people.find({"attendance.0": {"$exists": True}}, {"name": 1, "attendance": 1}):
+        by_day = {}
+        for entry in record["attendance"]:
+            if not isinstance(entry, dict):
+                entry = {"date": entry, "status": "present"}
+            if entry.get("status") == "registered":
+                continue  # Registration is kept on the person document
+            when = parse_legacy_date(entry.get("date"))
+            if when is None:
+                skipped += 1
+                continue
+            day = when.strftime(DAY_FORMAT)
+            if day in by_day and by_day[day]["status"] == "present":
+                continue
+            by_day[day] = {
+                "status": entry.get("status", "present"),
+                "time": entry.get("time") or (when.strftime(TIME_FORMAT) if when.hour or when.minute else None),
+                "camera_id": entry.get("camera_id"),
+                "latitude": entry.get("latitude"),
+                "longitude": entry.get("longitude"),
+            }
+
+        for day, event in by_day.items():
+            operations.append(UpdateOne({"name": record["name"], "day": day}, {"$setOnInsert": event}, upsert=True))
+            if event["status"] == "present":
+                # Promote a previously backfilled non-present event for the day
+                operations.append(UpdateOne(
+                    {"name": record["name"], "day": day, "status": {"$ne": "present"}},
+                    {"$set": event},
+                ))
+            if len(operations) >= batch_size:
+                written += events.bulk_write(operations, ordered=False).upserted_count
+                operations = []
+
+    if operations:
+        written += events.bulk_write(operations, ordered=False).upserted_count
+    return written, skipped
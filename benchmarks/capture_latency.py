@@ -0,0 +1,134 @@
+"""How stale are the frames a slow consumer gets from a live stream?
+
+Compares frame_source.CaptureWorker (continuous grab, newest frame only)
+with reading a plain cv2.VideoCapture on demand, as the app used to:
+
+    python benchmarks/capture_latency.py                      # synthetic file stand-in
+    python benchmarks/capture_latency.py --work-ms 300 --decode-every 3
+    python benchmarks/capture_latency.py --source rtsp://127.0.0.1:8554/door --json out.json
+
+With no --source, a short video is generated whose frames carry their
+index as a pattern of black and white blocks; CaptureWorker plays files at
+their frame rate and loops them, so it behaves like a camera. Staleness is
+how many frame intervals the consumer's frame lags the live position.
+For a real or loopback RTSP stream only frame age and drop counts are
+reported.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import frame_source  # noqa: E402
+
+BITS = 16
+BLOCK = 16  # Pixels per bit block; large enough to survive MJPEG compression
+
+
+def write_standin(path, frames, fps, size=(640, 480)):
+    """Write an MJPEG .avi whose frame ``i`` encodes ``i`` in its top row of blocks."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    for index in range(frames):
+        frame = np.full((size[1], size[0], 3), 64, dtype=np.uint8)
+        for bit in range(BITS):
+            value = 255 if index >> bit & 1 else 0
+            frame[:BLOCK, bit * BLOCK:(bit + 1) * BLOCK] = value
+        writer.write(frame)
+    writer.release()
+
+
+def frame_index(frame):
+    row = frame[BLOCK // 2, BLOCK // 2::BLOCK, 1][:BITS]
+    return sum(1 << bit for bit, value in enumerate(row) if value > 127)
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "mean": round(statistics.mean(values), 3),
+        "p50": round(values[len(values) // 2], 3),
+        "p95": round(values[int(0.95 * (len(values) - 1))], 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def consume_worker(source, args, fps):
+    worker = frame_source.acquire(source, decode_every=args.decode_every)
+    if worker is None:
+        raise SystemExit(f"❌ Could not open {frame_source.source_name(source)}")
+    try:
+        seq, frame = worker.wait_for_frame(timeout=5)
+        started = time.monotonic() - (frame_index(frame) / fps if args.synthetic else 0)
+        lags, ages = [], []
+        for _ in range(args.samples):
+            time.sleep(args.work_ms / 1000)  # Stand-in for recognition
+            seq, frame = worker.wait_for_frame(seq, timeout=5)
+            if frame is None:
+                continue
+            ages.append(worker.stats()["frame_age_s"])
+            if args.synthetic:
+                live = (time.monotonic() - started) * fps
+                lags.append(live - frame_index(frame))
+        return lags, ages, worker.stats()
+    finally:
+        worker.release()
+
+
+def consume_on_demand(source, args, fps):
+    capture = cv2.VideoCapture(source)
+    started = time.monotonic()
+    lags = []
+    for _ in range(args.samples):
+        time.sleep(args.work_ms / 1000)
+        success, frame = capture.read()
+        if not success:
+            break
+        lags.append((time.monotonic() - started) * fps - frame_index(frame))
+    capture.release()
+    return lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="RTSP URL or video file (default: a generated stand-in)")
+    parser.add_argument("--fps", type=float, default=25, help="frame rate of the generated stand-in")
+    parser.add_argument("--work-ms", type=float, default=150, help="simulated processing time per frame")
+    parser.add_argument("--samples", type=int, default=40, help="frames the consumer takes")
+    parser.add_argument("--decode-every", type=int, default=1)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+    args.synthetic = args.source is None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = args.source
+        if args.synthetic:
+            source = os.path.join(workdir, "standin.avi")
+            write_standin(source, int(args.fps * 60), args.fps)
+
+        lags, ages, stats = consume_worker(source, args, args.fps)
+        result = {"source": frame_source.source_name(source), "work_ms": args.work_ms,
+                  "decode_every": args.decode_every, "frame_age_s": summarize(ages), "stats": stats}
+        if args.synthetic:
+            result["lag_frames"] = {"capture_worker": summarize(lags),
+                                    "on_demand_read": summarize(consume_on_demand(source, args, args.fps))}
+
+    print(f"frame age at pickup: {result['frame_age_s']}")
+    print(f"grabbed {stats['grabbed']}, decoded {stats['decoded']}, skipped {stats['skipped']}, "
+          f"reconnects {stats['reconnects']}")
+    for mode, lag in result.get("lag_frames", {}).items():
+        print(f"{mode:>15}: lag p50 {lag['p50']:.1f} frames, max {lag['max']:.1f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
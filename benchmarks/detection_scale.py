@@ -0,0 +1,96 @@
+"""Latency/recall trade-off of detecting faces on downscaled frames.
+
+Runs detection.detect_faces over a set of images at several scales and
+compares every scale against full-resolution detection:
+
+    python benchmarks/detection_scale.py                      # faces/*.jpg
+    python benchmarks/detection_scale.py --video door.mp4 --frames 200
+    python benchmarks/detection_scale.py --scales 1 0.5 0.25 --json out.json
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detection import DetectionConfig, box_iou, detect_faces  # noqa: E402
+
+DEFAULT_SCALES = [1.0, 0.75, 0.5, 0.35, 0.25]
+
+
+def load_frames(args):
+    if args.video:
+        capture = cv2.VideoCapture(args.video)
+        frames = []
+        while len(frames) < args.frames:
+            success, frame = capture.read()
+            if not success:
+                break
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        capture.release()
+        return frames
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")))
+    return [cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB) for path in paths]
+
+
+def run(frames, scales, model="hog", repeat=1):
+    reference = [detect_faces(frame, DetectionConfig(model=model)) for frame in frames]
+    total_faces = sum(len(boxes) for boxes in reference)
+
+    results = []
+    for scale in scales:
+        config = DetectionConfig(scale=scale, model=model)
+        latencies = []
+        found = 0
+        for frame, expected in zip(frames, reference):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                boxes = detect_faces(frame, config)
+                latencies.append((time.perf_counter() - start) * 1000)
+            found += sum(1 for box in expected if any(box_iou(box, b) >= 0.5 for b in boxes))
+        latencies.sort()
+        results.append({
+            "scale": scale,
+            "mean_ms": round(statistics.mean(latencies), 2),
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+            "recall": round(found / total_faces, 3) if total_faces else None,
+        })
+    return results, total_faces
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default="faces", help="directory of .jpg images")
+    parser.add_argument("--video", help="video file or RTSP URL to sample frames from instead")
+    parser.add_argument("--frames", type=int, default=100, help="frames to sample from --video")
+    parser.add_argument("--scales", type=float, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--model", default="hog", choices=["hog", "cnn"])
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per frame and scale")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    if not frames:
+        print("❌ No frames to benchmark.")
+        sys.exit(1)
+
+    results, total_faces = run(frames, args.scales, args.model, args.repeat)
+    print(f"{len(frames)} frames, {total_faces} faces at full resolution ({args.model})")
+    print(f"{'scale':>6} {'mean ms':>9} {'p95 ms':>9} {'recall':>7}")
+    for row in results:
+        recall = "n/a" if row["recall"] is None else f"{row['recall']:.3f}"
+        print(f"{row['scale']:>6.2f} {row['mean_ms']:>9.2f} {row['p95_ms']:>9.2f} {recall:>7}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"frames": len(frames), "faces": total_faces, "model": args.model, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
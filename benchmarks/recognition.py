@@ -0,0 +1,258 @@
+"""Per-stage latency of the /mark_attendance path as the gallery grows.
+
+Times detection and encoding on real images, then matching, the presence
+check and the startup gallery load against synthetic galleries of 1k, 10k
+and 100k identities built around the real encodings:
+
+    python benchmarks/recognition.py                          # faces/*.jpg
+    python benchmarks/recognition.py --sizes 1000 10000 --samples 5 --json HEAD.json
+    python benchmarks/recognition.py --baseline main.json     # exit 1 on a regression
+    python benchmarks/recognition.py --compare main.json HEAD.json
+
+Synthetic identities are drawn with a fixed seed, so two runs on the same
+machine time the same work. Results carry the git commit they were taken
+at; ``--compare`` lines up two result files stage by stage.
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from face_index import ENCODING_DIM, FaceIndex  # noqa: E402
+from face_store import FaceStore  # noqa: E402
+from presence import PresenceCache  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_THRESHOLD = 1.2  # A stage this many times slower than the baseline is a regression
+
+# Spread of synthetic encodings, chosen so different identities sit about
+# 0.9 apart and samples of one identity about 0.35 apart, as with dlib
+IDENTITY_SPREAD = 0.9 / np.sqrt(2 * ENCODING_DIM)
+SAMPLE_SPREAD = 0.35 / np.sqrt(2 * ENCODING_DIM)
+
+
+def summarize(stage, latencies, gallery=None, **extra):
+    latencies = sorted(latencies)
+    row = {
+        "stage": stage,
+        "gallery": gallery,
+        "runs": len(latencies),
+        "mean_ms": round(statistics.mean(latencies), 4),
+        "p50_ms": round(latencies[len(latencies) // 2], 4),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 4),
+    }
+    row.update(extra)
+    return row
+
+
+def timed_runs(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def encode_images(images, repeat):
+    """Time detection and encoding on real images; returns ``(rows, encodings, names)``."""
+    import cv2
+    from detection import detect_faces, encode_faces
+
+    detect_ms, encode_ms = [], []
+    encodings, names = [], []
+    for path in images:
+        rgb_image = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+        boxes = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            boxes = detect_faces(rgb_image)
+            detect_ms.append((time.perf_counter() - start) * 1000)
+        if not boxes:
+            continue
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = encode_faces(rgb_image, boxes[:1])
+            encode_ms.append((time.perf_counter() - start) * 1000)
+        encodings.append(found[0])
+        names.append(os.path.splitext(os.path.basename(path))[0])
+
+    rows = []
+    if detect_ms:
+        rows.append(summarize("detect", detect_ms, images=len(images)))
+    if encode_ms:
+        rows.append(summarize("encode", encode_ms, images=len(encodings)))
+    return rows, encodings, names
+
+
+def synthetic_gallery(seeds, identities, samples, rng):
+    """Return ``(encodings, names, centres, identity_names)`` for the seeds plus random identities.
+
+    Extra identities are drawn around the seeds' mean; each gets ``samples`` noisy encodings.
+    """
+    seeds = np.asarray(seeds, dtype=np.float32).reshape(-1, ENCODING_DIM)
+    mean = seeds.mean(axis=0) if len(seeds) else rng.normal(0, 0.09, ENCODING_DIM).astype(np.float32)
+    extra = max(0, identities - len(seeds))
+    centres = np.concatenate([
+        seeds, mean + rng.normal(0, IDENTITY_SPREAD, (extra, ENCODING_DIM)).astype(np.float32)
+    ])
+    names = [f"seed-{i}" for i in range(len(seeds))] + [f"synthetic-{i}" for i in range(extra)]
+    encodings = np.repeat(centres, samples, axis=0)
+    encodings += rng.normal(0, SAMPLE_SPREAD, encodings.shape).astype(np.float32)
+    return encodings, [name for name in names for _ in range(samples)], centres, names
+
+
+def bench_gallery(size, seeds, args, rng, workdir):
+    rows = []
+    encodings, names, centres, identity_names = synthetic_gallery(seeds, size, args.samples, rng)
+
+    # Startup: the FaceStore load web_app does, and the legacy faces.pkl it replaced
+    store_path = os.path.join(workdir, f"faces-{size}")
+    FaceStore(store_path).append_many(encodings, names)
+    rows.append(summarize("gallery_load", timed_runs(
+        lambda: FaceStore(store_path).sync(FaceIndex(ivf_lists=args.ivf_lists)), args.load_repeat), size))
+    pickle_path = os.path.join(workdir, f"faces-{size}.pkl")
+    with open(pickle_path, "wb") as f:
+        pickle.dump((list(encodings.astype(np.float64)), names), f)
+
+    def load_pickle():
+        with open(pickle_path, "rb") as f:
+            FaceIndex(*pickle.load(f), ivf_lists=args.ivf_lists)
+
+    rows.append(summarize("pickle_load", timed_runs(load_pickle, args.load_repeat), size))
+
+    # Matching one face per request, as /mark_attendance does
+    index = FaceIndex(encodings, names, ivf_lists=args.ivf_lists)
+    index.match(centres[:1])  # Builds the centroid cache / IVF lists outside the timed runs
+    targets = rng.integers(0, len(centres), args.queries)
+    queries = centres[targets] + rng.normal(0, SAMPLE_SPREAD, (args.queries, ENCODING_DIM)).astype(np.float32)
+    latencies, correct = [], 0
+    for query, target in zip(queries, targets):
+        start = time.perf_counter()
+        (name, _), = index.match(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct += name == identity_names[target]
+    rows.append(summarize("match", latencies, size, samples=args.samples, accuracy=round(correct / len(targets), 4)))
+
+    # Presence check with half the roster already marked today
+    presence = PresenceCache(db_fn=lambda: None)
+    for name in identity_names[::2]:
+        presence.add(name)
+    latencies = []
+    for target in targets:
+        start = time.perf_counter()
+        presence.is_marked(identity_names[target])
+        latencies.append((time.perf_counter() - start) * 1000)
+    rows.append(summarize("presence_check", latencies, size))
+    return rows
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "taken_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Print each stage's p50 against the baseline; returns the regressed stages."""
+    before = {(row["stage"], row["gallery"]): row for row in baseline["results"]}
+    regressions = []
+    print(f"{baseline['environment'].get('commit')} -> {current['environment'].get('commit')}")
+    print(f"{'stage':>15} {'gallery':>8} {'before ms':>10} {'after ms':>10} {'ratio':>7}")
+    for row in current["results"]:
+        old = before.get((row["stage"], row["gallery"]))
+        if old is None or not old["p50_ms"]:
+            continue
+        ratio = row["p50_ms"] / old["p50_ms"]
+        flag = ""
+        if ratio > threshold:
+            flag = " ❌"
+            regressions.append(row["stage"])
+        print(f"{row['stage']:>15} {row['gallery'] or '-':>8} {old['p50_ms']:>10.4f} "
+              f"{row['p50_ms']:>10.4f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", default=os.path.join(ROOT, "faces"), help="directory of .jpg images")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="gallery sizes in identities")
+    parser.add_argument("--samples", type=int, default=1, help="encodings per identity")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="benchmark FaceIndex's approximate mode")
+    parser.add_argument("--queries", type=int, default=200, help="match calls per gallery size")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per image for detect/encode")
+    parser.add_argument("--load-repeat", type=int, default=3, help="timed gallery loads per size")
+    parser.add_argument("--no-detection", action="store_true", help="skip detect/encode (no dlib needed)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against an earlier result file; exit 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="only compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*map(load_results, args.compare), args.threshold) else 0)
+
+    rng = np.random.default_rng(args.seed)
+    rows, seeds = [], []
+    images = sorted(glob.glob(os.path.join(args.images, "*.jpg")))
+    if not args.no_detection:
+        try:
+            rows, seeds, _ = encode_images(images, args.repeat)
+        except ImportError as e:
+            print(f"⚠️ Skipping detect/encode: {e}")
+    if not seeds:
+        print("ℹ️ No real encodings; the synthetic gallery is centred on random values.")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            rows.extend(bench_gallery(size, seeds, args, rng, workdir))
+
+    result = {
+        "environment": environment(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline", "compare")},
+        "results": rows,
+    }
+    print(f"{'stage':>15} {'gallery':>8} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for row in rows:
+        print(f"{row['stage']:>15} {row['gallery'] or '-':>8} {row['mean_ms']:>10.4f} "
+              f"{row['p50_ms']:>10.4f} {row['p95_ms']:>10.4f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline and compare(load_results(args.baseline), result, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
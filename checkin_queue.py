@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from pymongo.errors import PyMongoError
+
+import attendance_events
+import metrics
+
+DEFAULT_PATH = os.getenv("CHECKIN_QUEUE_PATH", "checkins.db")
+FLUSH_INTERVAL = 1.0  # Seconds between flushes while MongoDB is reachable
+MAX_BACKOFF = 60.0  # Longest wait between retries during an outage
+BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkins (
+    name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    marked_at TEXT NOT NULL,
+    camera_id TEXT,
+    latitude REAL,
+    longitude REAL,
+    flushed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, day)
+);
+CREATE INDEX IF NOT EXISTS pending_checkins ON checkins (marked_at) WHERE flushed = 0;
+"""
+
+
+class CheckinQueue:
+    """Write-behind log of check-ins in a local SQLite database.
+
+    ``mark_present()`` only writes to local disk, so check-ins keep working
+    while MongoDB is slow or unreachable. A background thread replays the
+    pending rows into MongoDB in bulk (see attendance_events.mark_present_many),
+    backing off while it is down. Rows are keyed by (name, day) here and in
+    MongoDB, so a replay after a crash never double-counts.
+
+    With a ``presence`` cache (presence.PresenceCache), repeat sightings of
+    someone already marked today are answered from memory without touching
+    the disk either.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, db_fn=None, flush_interval=FLUSH_INTERVAL,
+                 batch_size=BATCH_SIZE, on_flush=None, presence=None):
+        self.path = path
+        self.presence = presence
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self._db_fn = db_fn
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")  # A check-in survives power loss once acknowledged
+            self._conn.executescript(_SCHEMA)
+        metrics.QUEUE_DEPTH.set_function(self.pending, queue="checkins_pending")
+
+    @property
+    def is_running(self):
+        return self._running
+
+    def mark_present(self, name, when=None, camera_id=None, latitude=None, longitude=None):
+        """Queue ``name`` as present; returns False if already queued for that day."""
+        when = when or datetime.now()
+        if self.presence is not None and self.presence.is_marked(name, when):
+            metrics.CHECKINS.inc(result="presence_hit")
+            return False
+        with metrics.timed("checkin_write"), self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO checkins (name, day, marked_at, camera_id, latitude, longitude) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (name, when.strftime(attendance_events.DAY_FORMAT), when.isoformat(),
+                 None if camera_id is None else str(camera_id), latitude, longitude),
+            )
+        metrics.CHECKINS.inc(result="queued" if cursor.rowcount else "duplicate")
+        if self.presence is not None:
+            self.presence.add(name, when)
+        if cursor.rowcount:
+            self._wake.set()
+        return cursor.rowcount == 1
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM checkins WHERE flushed = 0").fetchone()[0]
+
+    def flush(self):
+        """Replay pending check-ins into MongoDB; returns the number newly marked there.
+
+        Raises PyMongoError if MongoDB cannot be reached, leaving the rest queued.
+        """
+        marked = 0
+        db = self._get_db()
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT name, day, marked_at, camera_id, latitude, longitude FROM checkins "
+                    "WHERE flushed = 0 ORDER BY marked_at LIMIT ?",
+                    (self.batch_size,),
+                ).fetchall()
+            if not rows:
+                break
+            with metrics.timed("mongo_flush"):
+                marked += attendance_events.mark_present_many(
+                    db, [(name, datetime.fromisoformat(marked_at), camera_id, latitude, longitude)
+                         for name, _, marked_at, camera_id, latitude, longitude in rows]
+                )
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "UPDATE checkins SET flushed = 1 WHERE name = ? AND day = ?", [row[:2] for row in rows]
+                )
+        with self._lock, self._conn:
+            # Today's flushed rows stay behind to answer "already marked" locally
+            self._conn.execute(
+                "DELETE FROM checkins WHERE flushed = 1 AND day < ?",
+                (datetime.now().strftime(attendance_events.DAY_FORMAT),),
+            )
+        if marked and self.on_flush is not None:
+            self.on_flush(marked)
+        return marked
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="checkin-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, flush=True):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if flush:
+            try:
+                self.flush()
+            except PyMongoError:
+                pass  # Still queued on disk; the next start picks it up
+
+    def _get_db(self):
+        if self._db_fn is None:
+            import repository
+
+            return repository.get_db()
+        return self._db_fn()
+
+    def _run(self):
+        delay = self.flush_interval
+        offline = False
+        while self._running:
+            self._wake.wait(delay)
+            self._wake.clear()
+            if not self._running:
+                break
+            try:
+                marked = self.flush()
+            except PyMongoError as e:
+                if not offline:
+                    print(f"⚠️ MongoDB unreachable, queuing check-ins locally: {e}")
+                offline = True
+                delay = min(delay * 2, MAX_BACKOFF)
+                continue
+            if offline:
+                print(f"✅ MongoDB reachable again; flushed {marked} queued check-ins.")
+            offline = False
+            delay = self.flush_interval
@@ -1,127 +1,169 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 import cv2
-import face_recognition
 import datetime
-import os
-import pickle
-import pymongo
+import queue
+import threading
 from dotenv import load_dotenv
-from schema import add_attendance_entry, mongo_url  # Ensure to adjust the import as needed
+from face_index import FaceIndex
+from face_store import FaceStore
+from tracker import FaceTracker
+from detection import config_for, load_models
+from checkin_queue import CheckinQueue
+import frame_source
+from presence import PresenceCache
+import metrics
+from warmup import Warmup
 
 # Load environment variables
 load_dotenv()
-MONGO_CONNECTION_STRING = mongo_url
 
-# Load stored face data and attendance records
-FACE_DATA_FILE = "faces.pkl"
-ATTENDANCE_FILE = "attendance.pkl"
-known_face_encodings = []
-known_face_names = []
-attendance_records = {}
+# Load stored face data
+FACE_STORE_PATH = "faces"  # faces.f32 + faces.names, see face_store.py
 
-if os.path.exists(FACE_DATA_FILE):
-    with open(FACE_DATA_FILE, "rb") as f:
-        known_face_encodings, known_face_names = pickle.load(f)
+face_store = FaceStore(FACE_STORE_PATH)
+face_index = FaceIndex()
 
-if os.path.exists(ATTENDANCE_FILE):
-    with open(ATTENDANCE_FILE, "rb") as f:
-        attendance_records = pickle.load(f)
+# The window opens straight away; the dlib models and the gallery load behind it
+warmup = Warmup()
+warmup.add("models", load_models)
+warmup.add("gallery", lambda: face_store.sync(face_index))
+warmup.start()
 
-# MongoDB connection setup
-client = pymongo.MongoClient(MONGO_CONNECTION_STRING)
-db = client["attendanceDB"]
-attendance_collection = db["attendance"]
-
-# Function to save attendance records
-def save_attendance():
-    with open(ATTENDANCE_FILE, "wb") as f:
-        pickle.dump(attendance_records, f)
+# Check-ins go to a local queue first and reach MongoDB in the background,
+# so the door keeps working while the connection is down
+presence = PresenceCache()  # Repeat sightings today are answered from memory
+presence.start()
+checkin_queue = CheckinQueue(presence=presence)
+checkin_queue.start()
+metrics.start_http_server()  # Only if METRICS_PORT is set
 
 # Function to mark attendance in MongoDB
-def mark_attendance_in_mongo(name, phone, latitude, longitude):
+def mark_attendance_in_mongo(name, latitude, longitude):
     now = datetime.datetime.now()
     date = now.strftime("%d-%m-%y %H:%M")
-    record = attendance_collection.find_one({"name": name})
-    if record:
-        if not isinstance(record.get("attendance", []), list):
-            attendance_collection.update_one({"name": name}, {"$set": {"attendance": []}})
-            record["attendance"] = []
-        elif isinstance(record["attendance"], list):
-            record["attendance"] = [
-                entry if isinstance(entry, dict) else {"date": entry, "status": "present", "latitude": None, "longitude": None}
-                for entry in record["attendance"]
-            ]
-            attendance_collection.update_one({"name": name}, {"$set": {"attendance": record["attendance"]}})
-        
-        if record.get("phone") != phone:
-            attendance_collection.update_one({"name": name}, {"$set": {"phone": phone}})
-            print(f"ℹ️ Updated phone number for {name} to {phone}.")
-        
-        if any(entry["date"] == date for entry in record["attendance"]):
-            print(f"⚠️ Attendance already marked for {name} at {date}.")
-        else:
-            add_attendance_entry(name, phone, date, "present", latitude, longitude)
-            print(f"✅ Attendance marked for {name} at {date}.")
+    if checkin_queue.mark_present(name, now, latitude=latitude, longitude=longitude):
+        print(f"✅ Attendance marked for {name} at {date}.")
     else:
-        add_attendance_entry(name, phone, date, "present", latitude, longitude)
-        print(f"✅ Attendance marked for new user {name} at {date}.")
+        print(f"⚠️ Attendance already marked for {name} today.")
+
+DISPLAY_INTERVAL_MS = 10  # How often Tk looks for a new frame; the camera sets the actual rate
+
+capture_worker = None
+recognition_thread = None
+stop_recognition = threading.Event()
+recognition_results = queue.Queue()  # (kind, payload) posted by the recognition thread for Tk
+
+def ppm_image(frame):
+    """Binary PPM of a BGR frame, which Tk reads without any decompression."""
+    height, width = frame.shape[:2]
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return b"P6\n%d %d\n255\n" % (width, height) + rgb.tobytes()
+
+def recognize_frames(worker, face_tracker):
+    """Track faces on the newest frames and mark attendance, off the Tk thread."""
+    seq = None
+    while not stop_recognition.is_set():
+        seq, frame = worker.wait_for_frame(seq, timeout=0.5)
+        if frame is None:
+            if not worker.is_opened:
+                break
+            continue
+
+        boxes = []
+        for track in face_tracker.update(frame):
+            name = track.label
+
+            # Only act when a track gets its identity, not on every frame it is seen
+            if track.identified and track.name is not None:
+                latitude, longitude = 12.9716, 77.5946  # Replace with actual GPS
+                mark_attendance_in_mongo(name, latitude, longitude)
+
+                print(f"Hello {name}, good to see you again!")
+            elif track.identified:
+                print("I see a new face. Please register first.")
+                recognition_results.put(("warning", "Unrecognized face. Please register first."))
+            boxes.append((track.box, name))
+        recognition_results.put(("boxes", boxes))
 
 # Function to capture attendance using webcam
 def capture_attendance():
-    global video_capture, camera_canvas, exit_button_frame
+    global capture_worker, recognition_thread
 
-    video_capture = cv2.VideoCapture(0)
+    if capture_worker is not None:
+        return
+    warmup.wait()  # Usually finished long before the first click
 
     # Reduce resolution for faster load (e.g., 640x480)
-    video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    capture_worker = frame_source.acquire(0, width=640, height=480)
+    if capture_worker is None:
+        messagebox.showerror("Error", "Webcam access failed.")
+        return
+
+    # Full detection every few frames, optical-flow tracking in between; runs at
+    # its own pace while the preview keeps up with the camera
+    face_tracker = FaceTracker(face_index, config=config_for(0))
+    stop_recognition.clear()
+    recognition_thread = threading.Thread(
+        target=recognize_frames, args=(capture_worker, face_tracker), name="recognition", daemon=True
+    )
+    recognition_thread.start()
+
+    frame_clock = metrics.FrameClock("tk", 30)
+    image_item = camera_canvas.create_image(0, 0, anchor="nw")
+    boxes = []
+    shown = None
 
     def update_frame():
-        ret, frame = video_capture.read()
-        if not ret:
+        nonlocal boxes, shown
+        worker = capture_worker
+        if worker is None:
+            return
+        if not worker.is_opened:
             print("Failed to grab frame")
             return
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-        for face_encoding, (top, right, bottom, left) in zip(face_encodings, face_locations):
-            matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-            name = "Stranger"
-
-            if True in matches:
-                match_index = matches.index(True)
-                name = known_face_names[match_index]
-
-                record = attendance_collection.find_one({"name": name})
-                phone = record["phone"] if record and "phone" in record else "Unknown"
-                latitude, longitude = 12.9716, 77.5946  # Replace with actual GPS
-                mark_attendance_in_mongo(name, phone, latitude, longitude)
-
-                print(f"Hello {name}, good to see you again!")
+        # Newest tracks first, so they are drawn on this frame
+        while True:
+            try:
+                kind, payload = recognition_results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "boxes":
+                boxes = payload
             else:
-                print("I see a new face. Please register first.")
-                messagebox.showwarning("Warning", "Unrecognized face. Please register first.")
-
-            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-            cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-
-        # Update the Canvas to display the frame
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        photo = tk.PhotoImage(data=cv2.imencode(".png", frame_rgb)[1].tobytes())
-        camera_canvas.create_image(0, 0, anchor="nw", image=photo)
-        camera_canvas.image = photo
-
-        camera_canvas.after(10, update_frame)
+                messagebox.showwarning("Warning", payload)
+
+        frame = worker.latest()
+        if frame is not None and frame is not shown:
+            shown = frame
+            frame_clock.tick()
+            with metrics.timed("tk_display"):
+                frame = frame.copy()  # Capture frames are shared and read-only
+                for (top, right, bottom, left), name in boxes:
+                    cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+                    cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+                photo = tk.PhotoImage(data=ppm_image(frame), format="PPM")
+                camera_canvas.itemconfigure(image_item, image=photo)
+                camera_canvas.image = photo
+
+        camera_canvas.after(DISPLAY_INTERVAL_MS, update_frame)
 
     update_frame()
 
 # Function to handle exit on camera screen
 def exit_capture():
-    video_capture.release()
+    global capture_worker, recognition_thread
+
+    stop_recognition.set()
+    if recognition_thread is not None:
+        recognition_thread.join(timeout=2)
+        recognition_thread = None
+    if capture_worker is not None:
+        capture_worker.release()
+        capture_worker = None
     cv2.destroyAllWindows()
+    checkin_queue.stop()  # Last attempt to flush; anything left stays queued on disk
     print("Exited capture mode.")
     root.quit()
 
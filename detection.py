@@ -0,0 +1,164 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+CAMERA_CONFIG_FILE = os.getenv("CAMERA_CONFIG_FILE", "cameras.json")
+
+
+class DetectionConfig:
+    """Per-camera face detection settings.
+
+    ``scale`` shrinks the frame before detection (boxes are mapped back to
+    full resolution, and encodings are always taken from the full-resolution
+    frame). ``roi`` is an optional polygon of ``[x, y]`` points in
+    full-resolution pixels, e.g. a doorway: only that part of the frame is
+    searched, and faces centred outside it are ignored.
+    """
+
+    def __init__(self, scale=1.0, roi=None, model="hog", upsample=1):
+        self.scale = scale
+        self.roi = np.asarray(roi, dtype=np.int32) if roi else None
+        self.model = model
+        self.upsample = upsample
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            scale=data.get("scale", 1.0),
+            roi=data.get("roi"),
+            model=data.get("model", "hog"),
+            upsample=data.get("upsample", 1),
+        )
+
+
+DEFAULT_CONFIG = DetectionConfig()
+_camera_configs = None  # See camera_configs()
+
+
+def load_models():
+    """Import face_recognition, which loads the dlib models; takes about a second the first time.
+
+    Deferred until first use so importing this module stays cheap.
+    """
+    import face_recognition
+
+    return face_recognition
+
+
+def load_camera_configs(path=CAMERA_CONFIG_FILE):
+    """Read ``{source: {scale, roi, model, upsample}}`` from a JSON file."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {source: DetectionConfig.from_dict(data) for source, data in json.load(f).items()}
+
+
+def camera_configs():
+    """The configs from CAMERA_CONFIG_FILE, read once on first use."""
+    global _camera_configs
+    if _camera_configs is None:
+        _camera_configs = load_camera_configs()
+    return _camera_configs
+
+
+def reload_camera_configs():
+    """Re-read CAMERA_CONFIG_FILE, e.g. after editing it on a running server."""
+    global _camera_configs
+    _camera_configs = load_camera_configs()
+    return _camera_configs
+
+
+def config_for(source, configs=None):
+    """Return the detection config for a webcam index or RTSP URL."""
+    if configs is None:
+        configs = camera_configs()
+    return configs.get(str(source), DEFAULT_CONFIG)
+
+
+def detect_faces(rgb_frame, config=None):
+    """Return face boxes as (top, right, bottom, left) in full-resolution pixels."""
+    face_recognition = load_models()
+    config = config or DEFAULT_CONFIG
+    image, offset = _prepare(rgb_frame, config)
+    locations = face_recognition.face_locations(image, config.upsample, config.model)
+    return _remap(locations, rgb_frame.shape, offset, config)
+
+
+def detect_faces_batch(rgb_frames, configs):
+    """Detect faces in several frames, e.g. one per camera.
+
+    Frames using the CNN model whose prepared images share a size go through
+    dlib's batched CNN detector in one call; HOG frames are detected one by
+    one, as dlib has no batched HOG path.
+    """
+    face_recognition = load_models()
+    results = [None] * len(rgb_frames)
+    batches = {}
+    for i, (rgb_frame, config) in enumerate(zip(rgb_frames, configs)):
+        config = config or DEFAULT_CONFIG
+        image, offset = _prepare(rgb_frame, config)
+        if config.model == "cnn":
+            batches.setdefault((image.shape, config.upsample), []).append((i, image, offset, config))
+        else:
+            locations = face_recognition.face_locations(image, config.upsample, config.model)
+            results[i] = _remap(locations, rgb_frame.shape, offset, config)
+
+    for (_, upsample), items in batches.items():
+        images = [image for _, image, _, _ in items]
+        batch = face_recognition.batch_face_locations(images, upsample, batch_size=len(images))
+        for (i, _, offset, config), locations in zip(items, batch):
+            results[i] = _remap(locations, rgb_frames[i].shape, offset, config)
+    return results
+
+
+def _prepare(rgb_frame, config):
+    """Crop to the region of interest and downscale; return (image, offset)."""
+    height, width = rgb_frame.shape[:2]
+
+    # Only search the bounding rectangle of the region of interest
+    off_x, off_y = 0, 0
+    image = rgb_frame
+    if config.roi is not None:
+        x, y, w, h = cv2.boundingRect(config.roi)
+        off_x, off_y = max(x, 0), max(y, 0)
+        image = rgb_frame[off_y:min(y + h, height), off_x:min(x + w, width)]
+
+    if config.scale != 1.0:
+        image = cv2.resize(image, None, fx=config.scale, fy=config.scale, interpolation=cv2.INTER_AREA)
+    return image, (off_x, off_y)
+
+
+def _remap(locations, shape, offset, config):
+    """Map boxes found on a prepared image back to full-resolution pixels."""
+    height, width = shape[:2]
+    off_x, off_y = offset
+    boxes = []
+    for top, right, bottom, left in locations:
+        top = min(max(int(top / config.scale) + off_y, 0), height)
+        right = min(max(int(right / config.scale) + off_x, 0), width)
+        bottom = min(max(int(bottom / config.scale) + off_y, 0), height)
+        left = min(max(int(left / config.scale) + off_x, 0), width)
+        if config.roi is not None:
+            centre = ((left + right) / 2, (top + bottom) / 2)
+            if cv2.pointPolygonTest(config.roi, centre, False) < 0:
+                continue
+        boxes.append((top, right, bottom, left))
+    return boxes
+
+
+def encode_faces(rgb_frame, boxes):
+    """Encode ``boxes`` from the full-resolution frame."""
+    return load_models().face_encodings(rgb_frame, boxes)
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
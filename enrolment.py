@@ -0,0 +1,287 @@
+"""Bulk enrolment from a folder of photos or a registration spreadsheet.
+
+    python enrolment.py faces/                      # one person per image, named after the file
+    python enrolment.py registration.xlsx           # Name, Phone, Image columns
+    python enrolment.py registration.xlsx --images photos/ --workers 8
+
+Images are hashed first and unchanged ones are skipped, the rest are
+decoded and encoded on a process pool, and the results are written with
+one FaceStore.append_many and one bulk upsert of person records.
+
+Live enrolment (web /register, Kivy RegisterScreen) goes through
+``pick_samples()``: a burst of frames is quality-checked and reduced to a
+few representative encodings per person.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import attendance_events
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MAX_IMAGE_SIDE = 1600  # Larger photos are downscaled before detection
+DEFAULT_MANIFEST = "faces.enrolled.json"  # sha256 -> name of every enrolled image
+DEFAULT_IMAGES_DIR = "faces"  # Where the apps keep registration photos
+
+# Live enrolment
+BURST_FRAMES = int(os.getenv("ENROL_BURST_FRAMES", 10))
+BURST_INTERVAL = 0.15  # Seconds between burst frames, so samples differ a little
+SAMPLES_PER_PERSON = int(os.getenv("ENROL_SAMPLES", 5))
+MIN_SHARPNESS = float(os.getenv("ENROL_MIN_SHARPNESS", 60))  # Variance of the Laplacian over the face
+MIN_FACE_SIZE = 80  # Pixels; smaller faces encode poorly
+OUTLIER_DISTANCE = 0.4  # Samples this far from the burst's median are dropped
+
+
+def largest_face(face_locations):
+    return max(face_locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+
+
+def sharpness(frame, box):
+    """Variance of the Laplacian over a face box; low values mean blur."""
+    import cv2
+
+    top, right, bottom, left = box
+    face = frame[max(top, 0):bottom, max(left, 0):right]
+    if not face.size:
+        return 0.0
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY) if face.ndim == 3 else face
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def select_samples(encodings, count=SAMPLES_PER_PERSON):
+    """Return indexes of up to ``count`` representative encodings.
+
+    Outliers far from the burst's median (e.g. someone walking past) are
+    dropped, then samples are picked farthest-first starting from the one
+    closest to the median, so they cover the range of poses in the burst.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32)
+    if len(encodings) <= 1:
+        return list(range(len(encodings)))
+    # The median is not dragged away by a single stray face the way the mean is
+    distances = np.linalg.norm(encodings - np.median(encodings, axis=0), axis=1)
+    keep = np.flatnonzero(distances <= OUTLIER_DISTANCE)
+    if not len(keep):
+        keep = np.array([distances.argmin()])
+    chosen = [keep[distances[keep].argmin()]]
+    nearest = np.linalg.norm(encodings[keep] - encodings[chosen[0]], axis=1)
+    while len(chosen) < min(count, len(keep)):
+        pick = keep[nearest.argmax()]
+        chosen.append(pick)
+        nearest = np.minimum(nearest, np.linalg.norm(encodings[keep] - encodings[pick], axis=1))
+    return [int(index) for index in chosen]
+
+
+def pick_samples(frames, results, count=SAMPLES_PER_PERSON):
+    """Reduce a burst to the encodings worth keeping.
+
+    ``results`` holds ``(face_locations, face_encodings)`` for each BGR
+    frame. Returns ``(encodings, best_frame, reason)``: the chosen
+    encodings, the sharpest accepted frame (for the profile photo) and, when
+    nothing was usable, why.
+    """
+    samples = []
+    reason = "No face detected. Please try again."
+    for frame, (face_locations, face_encodings) in zip(frames, results):
+        if not face_locations:
+            continue
+        box = largest_face(face_locations)
+        if min(box[2] - box[0], box[1] - box[3]) < MIN_FACE_SIZE:
+            reason = "Face too small. Please move closer to the camera."
+            continue
+        score = sharpness(frame, box)
+        if score < MIN_SHARPNESS:
+            reason = "Image too blurry. Please hold still and try again."
+            continue
+        samples.append((face_encodings[face_locations.index(box)], score, frame))
+    if not samples:
+        return [], None, reason
+
+    chosen = select_samples([encoding for encoding, _, _ in samples], count)
+    best_frame = max(samples, key=lambda sample: sample[1])[2]
+    return [samples[index][0] for index in chosen], best_frame, None
+
+
+def roster_from_directory(path):
+    """Return ``[(name, phone, image_path)]`` for every image in ``path``, named after the file."""
+    return [
+        (os.path.splitext(entry)[0], None, os.path.join(path, entry))
+        for entry in sorted(os.listdir(path))
+        if entry.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+
+
+def roster_from_xlsx(path, images_dir=None):
+    """Return ``[(name, phone, image_path)]`` from a sheet with Name, Phone and Image columns.
+
+    Relative image paths are resolved against ``images_dir`` (default:
+    ``faces/``, where the apps keep photos); a missing Image cell means
+    ``<images_dir>/<name>.jpg``.
+    """
+    # Only needed for spreadsheets, so it stays optional
+    from openpyxl import load_workbook
+
+    images_dir = images_dir or DEFAULT_IMAGES_DIR
+    sheet = load_workbook(path, read_only=True, data_only=True).active
+    rows = sheet.iter_rows(values_only=True)
+    header = [str(cell or "").strip().lower() for cell in next(rows, ())]
+    if "name" not in header:
+        raise ValueError(f"{path} has no Name column")
+    columns = {field: header.index(field) for field in ("name", "phone", "image") if field in header}
+
+    def cell(row, field):
+        index = columns.get(field)
+        value = row[index] if index is not None and index < len(row) else None
+        return str(value).strip() if value is not None and str(value).strip() else None
+
+    roster = []
+    for row in rows:
+        name = cell(row, "name")
+        if not name:
+            continue
+        image = cell(row, "image") or f"{name}.jpg"
+        roster.append((name, cell(row, "phone"), os.path.join(images_dir, image)))
+    return roster
+
+
+def load_roster(path, images_dir=None):
+    if os.path.isdir(path):
+        return roster_from_directory(path)
+    return roster_from_xlsx(path, images_dir)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def encode_image(path):
+    """Return ``(encoding, None)`` for the largest face in an image file, or ``(None, reason)``.
+
+    Runs on the worker processes.
+    """
+    import cv2
+    from detection import detect_faces, encode_faces
+
+    image = cv2.imread(path)
+    if image is None:
+        return None, "unreadable image"
+    scale = MAX_IMAGE_SIDE / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    face_locations = detect_faces(rgb_image)
+    if not face_locations:
+        return None, "no face found"
+    return encode_faces(rgb_image, [largest_face(face_locations)])[0], None
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    # Write-then-rename, so an interrupted run never leaves a truncated manifest
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, path)
+
+
+def enrol(roster, face_store, pool, db=None, manifest_path=DEFAULT_MANIFEST, camera_id=None):
+    """Enrol ``[(name, phone, image_path)]`` and return a summary dict.
+
+    ``pool`` is anything with an ordered ``map(fn, iterable, chunksize)``,
+    e.g. a RecognitionService. Person records are written to ``db`` if given.
+    """
+    started = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+    failed = []
+    jobs = []
+    unchanged = 0
+    for name, phone, image_path in roster:
+        if not os.path.exists(image_path):
+            failed.append({"name": name, "image": image_path, "reason": "image not found"})
+            continue
+        digest = file_hash(image_path)
+        if manifest.get(digest) == name:
+            unchanged += 1
+            continue
+        jobs.append((name, phone, image_path, digest))
+
+    encodings, names = [], []
+    chunksize = max(1, len(jobs) // (getattr(pool, "workers", 1) * 4))
+    for (name, phone, image_path, digest), (encoding, error) in zip(
+            jobs, pool.map(encode_image, [job[2] for job in jobs], chunksize=chunksize)):
+        if error:
+            failed.append({"name": name, "image": image_path, "reason": error})
+            continue
+        encodings.append(encoding)
+        names.append(name)
+        manifest[digest] = name
+
+    face_store.append_many(encodings, names)
+    # Saved before the database write: if that fails, a rerun must not append the same faces again
+    save_manifest(manifest_path, manifest)
+    # Person records for everyone with a usable photo, including unchanged ones, so a rerun retries them
+    failed_names = {failure["name"] for failure in failed}
+    people = [(name, phone) for name, phone, _ in roster if name not in failed_names]
+    created = attendance_events.register_people(db, people, camera_id=camera_id) if db is not None and people else 0
+
+    return {
+        "roster": len(roster),
+        "enrolled": len(names),
+        "unchanged": unchanged,
+        "failed": failed,
+        "people_created": created,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enrol faces in bulk from a folder or registration.xlsx.")
+    parser.add_argument("source", nargs="?", default="faces", help="image folder or .xlsx roster")
+    parser.add_argument("--images", help=f"folder holding the roster's images (default: {DEFAULT_IMAGES_DIR}/)")
+    parser.add_argument("--store", default="faces", help="FaceStore path prefix")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-db", action="store_true", help="only update the face gallery")
+    args = parser.parse_args()
+
+    from face_store import FaceStore
+    from recognition_service import RecognitionService
+
+    roster = load_roster(args.source, args.images)
+    if not roster:
+        print(f"⚠️ No people found in {args.source}.")
+        sys.exit(1)
+
+    # Fork the workers before the MongoDB client opens its sockets
+    service = RecognitionService(args.workers)
+    service.start()
+    db = None
+    if not args.no_db:
+        import repository
+        db = repository.get_db()
+
+    try:
+        summary = enrol(roster, FaceStore(args.store), service, db, args.manifest)
+    finally:
+        service.shutdown()
+
+    for failure in summary["failed"]:
+        print(f"❌ {failure['name']}: {failure['reason']} ({failure['image']})")
+    print(f"✅ Enrolled {summary['enrolled']} of {summary['roster']} people "
+          f"({summary['unchanged']} unchanged, {len(summary['failed'])} failed, "
+          f"{summary['people_created']} new person records) in {summary['elapsed_ms']} ms.")
@@ -0,0 +1,234 @@
+import threading
+
+import numpy as np
+
+# Same default tolerance as face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+ENCODING_DIM = 128
+DEFAULT_CANDIDATES = 8  # Identities refined against their samples after the centroid pass
+
+
+class FaceIndex:
+    """In-memory gallery of known face encodings.
+
+    Encodings live in one contiguous float32 matrix so every face in a frame
+    is matched with a single batched distance computation.
+
+    When people are enrolled with several samples each, matching first
+    compares every query against one centroid per identity and then only
+    against the samples of the ``candidates`` nearest identities. Passing
+    ``ivf_lists`` instead enables an approximate mode that partitions the
+    gallery around k-means centroids and only scans the ``nprobe`` closest
+    lists; once the gallery is big enough for it, it replaces the centroid
+    pass rather than combining with it.
+
+    ``add()`` and ``match()`` may be called from different threads.
+    """
+
+    def __init__(self, encodings=(), names=(), tolerance=DEFAULT_TOLERANCE,
+                 ivf_lists=0, nprobe=4, candidates=DEFAULT_CANDIDATES):
+        self.tolerance = tolerance
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self.candidates = candidates
+        self.names = []
+        self._matrix = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._lock = threading.RLock()
+
+        # IVF state, (re)built lazily once the gallery is big enough
+        self._centroids = None
+        self._lists = None
+        self._trained_size = 0
+
+        # Per-identity sample rows and running sums for the centroid pass
+        self._identity_of = {}
+        self._identity_rows = []
+        self._identity_sums = np.empty((0, ENCODING_DIM), dtype=np.float64)  # Grown like _matrix
+        self._identity_centroids = None  # (centroids, squared norms, row arrays), rebuilt after adds
+
+        if len(names):
+            self.add(encodings, names)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def identities(self):
+        """Number of distinct names in the gallery."""
+        return len(self._identity_rows)
+
+    @property
+    def encodings(self):
+        """Read-only view of the stored encodings, one row per name."""
+        view = self._matrix[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def add(self, encodings, names):
+        """Add one encoding/name pair, or a batch of them."""
+        if isinstance(names, str):
+            encodings, names = [encodings], [names]
+        rows = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(rows) != len(names):
+            raise ValueError("encodings and names must have the same length")
+
+        with self._lock:
+            start = self._size
+            self._reserve(start + len(rows))
+            self._matrix[start:start + len(rows)] = rows
+            self._sq_norms[start:start + len(rows)] = np.einsum("ij,ij->i", rows, rows)
+            self.names.extend(names)
+            self._size += len(rows)
+            self._add_identities(rows, names, start)
+
+            if self._lists is not None:
+                # Route new rows to their nearest existing list; retrain once the
+                # gallery has doubled since the last k-means run.
+                if self._size >= 2 * self._trained_size:
+                    self._lists = None
+                else:
+                    for row, list_id in enumerate(self._nearest_lists(rows, 1)[:, 0], start):
+                        self._lists[list_id] = np.append(self._lists[list_id], row)
+
+    def match(self, face_encodings):
+        """Return ``(name, distance)`` for each query encoding.
+
+        ``name`` is None when the nearest known face is further away than the
+        tolerance, or when the gallery is empty.
+        """
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if not len(queries):
+            return []
+        with self._lock:
+            if not self._size:
+                return [(None, float("inf"))] * len(queries)
+
+            if self._use_ivf():
+                best_idx, best_dist = self._search_ivf(queries)
+            elif self._use_identities():
+                best_idx, best_dist = self._search_identities(queries)
+            else:
+                distances = self._distances(queries, self._matrix[:self._size], self._sq_norms[:self._size])
+                best_idx = distances.argmin(axis=1)
+                best_dist = distances[np.arange(len(queries)), best_idx]
+
+            results = []
+            for idx, dist in zip(best_idx, best_dist):
+                dist = float(dist)
+                name = self.names[idx] if dist <= self.tolerance else None
+                results.append((name, dist))
+            return results
+
+    def _reserve(self, size):
+        capacity = len(self._matrix)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 64)
+        matrix = np.empty((capacity, ENCODING_DIM), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        self._matrix, self._sq_norms = matrix, sq_norms
+
+    @staticmethod
+    def _distances(queries, rows, row_sq_norms):
+        # |q - r|^2 = |q|^2 + |r|^2 - 2 q.r, computed for the whole batch at once
+        q_sq = np.einsum("ij,ij->i", queries, queries)[:, None]
+        sq = q_sq + row_sq_norms[None, :] - 2.0 * (queries @ rows.T)
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq)
+
+    def _add_identities(self, rows, names, start):
+        new_names = [name for name in dict.fromkeys(names) if name not in self._identity_of]
+        if new_names:
+            count = len(self._identity_rows)
+            if count + len(new_names) > len(self._identity_sums):
+                capacity = max(count + len(new_names), 2 * len(self._identity_sums), 64)
+                sums = np.zeros((capacity, ENCODING_DIM), dtype=np.float64)
+                sums[:count] = self._identity_sums[:count]
+                self._identity_sums = sums
+            for name in new_names:
+                self._identity_of[name] = len(self._identity_rows)
+                self._identity_rows.append([])
+        for row, (encoding, name) in enumerate(zip(rows, names), start):
+            identity = self._identity_of[name]
+            self._identity_rows[identity].append(row)
+            self._identity_sums[identity] += encoding
+        self._identity_centroids = None
+
+    def _use_identities(self):
+        # Only worth it when identities have several samples and there are
+        # more identities than candidates to refine
+        identities = len(self._identity_rows)
+        return bool(self.candidates) and self.candidates < identities < self._size
+
+    def _search_identities(self, queries):
+        if self._identity_centroids is None:
+            counts = np.array([len(rows) for rows in self._identity_rows], dtype=np.float64)
+            centroids = (self._identity_sums[:len(counts)] / counts[:, None]).astype(np.float32)
+            self._identity_centroids = (
+                centroids,
+                np.einsum("ij,ij->i", centroids, centroids),
+                [np.asarray(rows, dtype=np.intp) for rows in self._identity_rows],
+            )
+        centroids, centroid_sq, identity_rows = self._identity_centroids
+
+        coarse = self._distances(queries, centroids, centroid_sq)
+        nearest = np.argpartition(coarse, self.candidates - 1, axis=1)[:, :self.candidates]
+        best_idx = np.zeros(len(queries), dtype=np.intp)
+        best_dist = np.full(len(queries), np.inf, dtype=np.float32)
+        for qi, identities in enumerate(nearest):
+            candidates = np.concatenate([identity_rows[identity] for identity in identities])
+            distances = self._distances(queries[qi:qi + 1], self._matrix[candidates], self._sq_norms[candidates])[0]
+            best = distances.argmin()
+            best_idx[qi] = candidates[best]
+            best_dist[qi] = distances[best]
+        return best_idx, best_dist
+
+    def _use_ivf(self):
+        if not self.ivf_lists or self._size < 4 * self.ivf_lists:
+            return False
+        if self._lists is None:
+            self._train()
+        return True
+
+    def _train(self, iterations=10):
+        """Run k-means over the gallery and bucket every row into a list."""
+        data = self._matrix[:self._size]
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(self._size, self.ivf_lists, replace=False)].copy()
+        for _ in range(iterations):
+            self._centroids = centroids
+            assign = self._nearest_lists(data, 1)[:, 0]
+            for list_id in range(self.ivf_lists):
+                members = data[assign == list_id]
+                if len(members):
+                    centroids[list_id] = members.mean(axis=0)
+        self._centroids = centroids
+        assign = self._nearest_lists(data, 1)[:, 0]
+        self._lists = [np.flatnonzero(assign == list_id) for list_id in range(self.ivf_lists)]
+        self._trained_size = self._size
+
+    def _nearest_lists(self, queries, count):
+        centroid_sq = np.einsum("ij,ij->i", self._centroids, self._centroids)
+        distances = self._distances(queries, self._centroids, centroid_sq)
+        if count >= len(self._centroids):
+            return np.argsort(distances, axis=1)
+        nearest = np.argpartition(distances, count - 1, axis=1)[:, :count]
+        return nearest
+
+    def _search_ivf(self, queries):
+        probes = self._nearest_lists(queries, min(self.nprobe, self.ivf_lists))
+        best_idx = np.zeros(len(queries), dtype=np.intp)
+        best_dist = np.full(len(queries), np.inf, dtype=np.float32)
+        for qi, lists in enumerate(probes):
+            candidates = np.concatenate([self._lists[list_id] for list_id in lists])
+            if not len(candidates):
+                continue
+            distances = self._distances(queries[qi:qi + 1], self._matrix[candidates], self._sq_norms[candidates])[0]
+            best = distances.argmin()
+            best_idx[qi] = candidates[best]
+            best_dist[qi] = distances[best]
+        return best_idx, best_dist
@@ -0,0 +1,203 @@
+import json
+import os
+import pickle
+import sys
+import threading
+
+import numpy as np
+
+from face_index import ENCODING_DIM
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still atomic per write, just not locked
+    fcntl = None
+
+ROW_BYTES = ENCODING_DIM * 4
+DEFAULT_STORE_PATH = "faces"
+LEGACY_PICKLE_FILE = "faces.pkl"
+
+
+class FaceStore:
+    """Append-only on-disk store of face encodings.
+
+    ``<path>.f32`` holds fixed-width float32 rows and is memory-mapped
+    read-only; ``<path>.names`` is a JSON-lines sidecar with one
+    ``{"id", "name"}`` record per row. Each process keeps a cursor, so
+    ``read_new()`` only returns rows appended since the previous call.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.encodings_path = path + ".f32"
+        self.names_path = path + ".names"
+        self.lock_path = path + ".lock"
+        self._rows_read = 0
+        self._names_offset = 0
+        self._pending_names = []
+        self._sync_lock = threading.Lock()
+
+    def __len__(self):
+        return self._available_rows()
+
+    def append(self, encoding, name):
+        """Atomically append one enrolment and return its row id."""
+        return self.append_many([encoding], [name])[0]
+
+    def append_many(self, encodings, names):
+        """Atomically append a batch of enrolments and return their row ids."""
+        rows = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        if len(rows) != len(names):
+            raise ValueError("encodings and names must have the same length")
+        if not len(rows):
+            return []
+
+        with self._locked():
+            first_id = self._repair()
+            ids = list(range(first_id, first_id + len(rows)))
+            # Encodings go first: a name line is only ever written for a row
+            # that is already on disk, so readers never see a name without data.
+            self._append_bytes(self.encodings_path, np.ascontiguousarray(rows).tobytes())
+            lines = "".join(json.dumps({"id": row_id, "name": name}) + "\n" for row_id, name in zip(ids, names))
+            self._append_bytes(self.names_path, lines.encode("utf-8"))
+        return ids
+
+    def read_new(self):
+        """Return ``(encodings, names)`` appended since the last call."""
+        self._read_names()
+        rows = min(self._encoding_rows(), self._rows_read + len(self._pending_names))
+        count = rows - self._rows_read
+        if count <= 0:
+            return np.empty((0, ENCODING_DIM), dtype=np.float32), []
+
+        mapped = np.memmap(self.encodings_path, dtype=np.float32, mode="r", shape=(rows, ENCODING_DIM))
+        encodings = np.array(mapped[self._rows_read:rows])
+        del mapped
+        names = self._pending_names[:count]
+        del self._pending_names[:count]
+        self._rows_read = rows
+        return encodings, names
+
+    def sync(self, face_index):
+        """Add any rows appended by this or other processes to ``face_index``.
+
+        Safe to call from several threads; each row is added exactly once.
+        """
+        with self._sync_lock:
+            encodings, names = self.read_new()
+            if names:
+                face_index.add(encodings, names)
+        return len(names)
+
+    def _encoding_rows(self):
+        try:
+            return os.path.getsize(self.encodings_path) // ROW_BYTES
+        except FileNotFoundError:
+            return 0
+
+    def _available_rows(self):
+        return min(self._encoding_rows(), self._last_named_row() + 1)
+
+    def _last_named_row(self):
+        """Return the id on the last complete name line, or -1 if there is none."""
+        tail, start = self._names_tail()
+        lines = tail[:tail.rfind(b"\n") + 1].splitlines()
+        return json.loads(lines[-1])["id"] if lines else -1
+
+    def _names_tail(self, size=4096):
+        """Return the end of the names file (back to a full line) and its offset."""
+        try:
+            with open(self.names_path, "rb") as f:
+                end = f.seek(0, os.SEEK_END)
+                start = end
+                tail = b""
+                while start > 0:
+                    start = max(0, start - size)
+                    f.seek(start)
+                    tail = f.read(end - start)
+                    # Need at least one complete line preceded by a line break
+                    if start == 0 or tail.count(b"\n") >= 2:
+                        break
+                if start > 0:
+                    cut = tail.index(b"\n") + 1
+                    tail, start = tail[cut:], start + cut
+                return tail, start
+        except FileNotFoundError:
+            return b"", 0
+
+    def _read_names(self):
+        try:
+            with open(self.names_path, "rb") as f:
+                f.seek(self._names_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # Only consume complete lines; a writer may be mid-append
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            self._pending_names.append(json.loads(line)["name"])
+        self._names_offset += end
+
+    def _repair(self):
+        """Drop rows left half-written by a crashed writer; return the next id."""
+        rows = self._available_rows()
+        if self._encoding_rows() and os.path.getsize(self.encodings_path) != rows * ROW_BYTES:
+            os.truncate(self.encodings_path, rows * ROW_BYTES)
+        tail, start = self._names_tail()
+        keep = start + tail.rfind(b"\n") + 1
+        if tail and keep != start + len(tail):
+            os.truncate(self.names_path, keep)
+        return rows
+
+    @staticmethod
+    def _append_bytes(path, data):
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _locked(self):
+        return _FileLock(self.lock_path)
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+def migrate_pickle(pickle_path=LEGACY_PICKLE_FILE, store_path=DEFAULT_STORE_PATH):
+    """One-shot import of a legacy ``faces.pkl`` into an empty FaceStore."""
+    store = FaceStore(store_path)
+    if len(store):
+        print(f"⚠️ {store.encodings_path} already has {len(store)} rows; skipping migration.")
+        return 0
+    if not os.path.exists(pickle_path):
+        print(f"⚠️ {pickle_path} not found; nothing to migrate.")
+        return 0
+
+    with open(pickle_path, "rb") as f:
+        known_face_encodings, known_face_names = pickle.load(f)
+    store.append_many(known_face_encodings, known_face_names)
+    print(f"✅ Migrated {len(known_face_names)} faces from {pickle_path} to {store.encodings_path}.")
+    return len(known_face_names)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python face_store.py migrate [faces.pkl] [store_path]")
+        sys.exit(1)
+    migrate_pickle(*sys.argv[2:4])
@@ -0,0 +1,303 @@
+import collections
+import os
+import threading
+import time
+import urllib.parse
+
+import cv2
+
+import metrics
+
+DEFAULT_BUFFER_SIZE = 2
+
+# Capture settings for every source unless overridden in acquire()
+DECODE_EVERY = int(os.getenv("CAPTURE_DECODE_EVERY", 1))  # Convert only every Nth frame nobody is waiting for
+CAPTURE_WIDTH = int(os.getenv("CAPTURE_WIDTH", 0)) or None  # Resolution hints; devices may ignore them
+CAPTURE_HEIGHT = int(os.getenv("CAPTURE_HEIGHT", 0)) or None
+
+# Network streams reconnect after a drop, waiting longer after each failed attempt
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = float(os.getenv("CAPTURE_MAX_RECONNECT_DELAY", 30))
+
+# Ask FFmpeg not to buffer RTSP input; set OPENCV_FFMPEG_CAPTURE_OPTIONS to override,
+# e.g. "rtsp_transport;tcp" on lossy networks
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "fflags;nobuffer|flags;low_delay")
+
+# Capture workers by source (webcam index or RTSP URL)
+_workers = {}
+_workers_lock = threading.Lock()
+_opening = {}  # source -> lock held while that device is being opened
+
+
+def source_name(source):
+    """``source`` for logs and metrics, without credentials from an RTSP URL."""
+    text = str(source)
+    parts = urllib.parse.urlsplit(text)
+    if parts.username is not None or parts.password is not None:
+        netloc = parts.hostname or ""
+        if parts.port:
+            netloc += f":{parts.port}"
+        text = urllib.parse.urlunsplit(parts._replace(netloc=netloc))
+    return text
+
+
+class CaptureWorker:
+    """Background thread that continuously drains one capture device.
+
+    The newest frames are kept in a small ring buffer; consumers get them by
+    reference through ``latest()`` or ``wait_for_frame()`` and never touch
+    the device themselves. Frames are shared, so treat them as read-only and
+    copy before drawing on them.
+
+    Every frame is grabbed as soon as it arrives, so the device's own buffer
+    never fills with stale frames, but with ``decode_every`` > 1 only every
+    Nth one is converted to BGR unless a consumer is waiting or calls
+    ``latest()`` while the newest decoded frame is behind. Network
+    streams reconnect with exponential backoff instead of stopping, and
+    video files are paced to their frame rate and looped, which makes them
+    a stand-in for a live camera. ``stats()`` reports frame counts, drops,
+    reconnects and frame age.
+
+    Workers are reference counted: use ``acquire()``/``release()`` rather than
+    constructing them directly.
+    """
+
+    def __init__(self, source, buffer_size=DEFAULT_BUFFER_SIZE, width=None, height=None, decode_every=1):
+        self.source = source
+        self.name = source_name(source)
+        self.width = width  # Requested capture size; the device may ignore it
+        self.height = height
+        self.decode_every = max(1, decode_every)
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.reconnects = isinstance(source, str) and not self.is_file
+        self._frames = collections.deque(maxlen=buffer_size)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._capture = None
+        self._thread = None
+        self._running = False
+        self._refs = 0
+        self._waiting = 0
+        self._stale = False  # Frames were grabbed but not decoded since the newest one in _frames
+        self._grabbed_at = None
+        self._grab_interval = 0.0  # Smoothed time between grabs
+        self._stats = {"grabbed": 0, "decoded": 0, "skipped": 0, "reconnects": 0}
+        self._connected = False
+
+    @property
+    def is_opened(self):
+        return self._running
+
+    def start(self):
+        self._capture = self._open()
+        if self._capture is None:
+            return False
+        self._running = True
+        self._connected = True
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.name}", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def release(self):
+        """Drop one reference; the device is closed when the last one goes."""
+        with _workers_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            if _workers.get(self.source) is self:
+                del _workers[self.source]
+        self.stop()
+
+    def latest(self):
+        """Return the newest frame, or None if nothing has been captured yet.
+
+        With ``decode_every`` > 1 the newest decoded frame may be behind the
+        stream; then the next grabbed frame is decoded and returned, waiting
+        at most about two frame intervals for it.
+        """
+        with self._cond:
+            if not self._frames:
+                return None
+            seq, frame, captured_at = self._frames[-1]
+            stale = self._stale and self._running
+            timeout = 2 * self._grab_interval
+        if stale:
+            _, newer = self.wait_for_frame(seq, timeout)
+            if newer is not None:
+                return newer
+        metrics.FRAME_AGE.observe(time.monotonic() - captured_at, source=self.name)
+        return frame
+
+    def wait_for_frame(self, after_seq=None, timeout=1.0):
+        """Block until a frame newer than ``after_seq`` arrives.
+
+        Returns ``(seq, frame)``; ``frame`` is None on timeout or once the
+        worker has stopped.
+        """
+        with self._cond:
+            self._waiting += 1
+            try:
+                self._cond.wait_for(
+                    lambda: not self._running or (self._frames and self._frames[-1][0] != after_seq),
+                    timeout,
+                )
+            finally:
+                self._waiting -= 1
+            if not self._frames or self._frames[-1][0] == after_seq:
+                return after_seq, None
+            seq, frame, captured_at = self._frames[-1]
+        metrics.FRAME_AGE.observe(time.monotonic() - captured_at, source=self.name)
+        return seq, frame
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            captured_at = self._frames[-1][2] if self._frames else None
+        stats.update({
+            "source": self.name,
+            "running": self._running,
+            "connected": self._connected,
+            "decode_every": self.decode_every,
+            "frame_age_s": None if captured_at is None else round(time.monotonic() - captured_at, 3),
+        })
+        return stats
+
+    def _open(self):
+        capture = cv2.VideoCapture(self.source)
+        if not capture.isOpened():
+            capture.release()
+            return None
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Honoured by some backends; the grab loop covers the rest
+        if self.width and self.height:
+            capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        return capture
+
+    def _reconnect(self):
+        """Reopen a dropped stream, backing off between attempts; False once stopped."""
+        delay = RECONNECT_DELAY
+        self._connected = False
+        while True:
+            print(f"⚠️ Lost capture source {self.name}; reconnecting in {delay:.0f}s.")
+            with self._cond:
+                self._cond.wait_for(lambda: not self._running, delay)
+                if not self._running:
+                    return False
+            self._capture = self._open()
+            if self._capture is not None:
+                print(f"✅ Reconnected to {self.name}.")
+                with self._cond:
+                    self._stats["reconnects"] += 1
+                metrics.CAPTURE_RECONNECTS.inc(source=self.name)
+                self._connected = True
+                return True
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _run(self):
+        # Files play at their own frame rate rather than as fast as they decode
+        interval = 1.0 / (self._capture.get(cv2.CAP_PROP_FPS) or 25) if self.is_file else 0
+        due = time.monotonic()
+        try:
+            while self._running:
+                capture = self._capture
+                if not capture.grab():
+                    if self.is_file and capture.set(cv2.CAP_PROP_POS_FRAMES, 0) and capture.grab():
+                        pass  # Looped back to the start
+                    elif self.reconnects:
+                        capture.release()
+                        if not self._reconnect():
+                            break
+                        continue
+                    else:
+                        print(f"❌ Lost capture source {self.name}.")
+                        break
+                grabbed_at = time.monotonic()
+                with self._cond:
+                    self._stats["grabbed"] += 1
+                    if self._grabbed_at is not None:
+                        gap = grabbed_at - self._grabbed_at
+                        self._grab_interval = gap if not self._grab_interval else 0.9 * self._grab_interval + 0.1 * gap
+                    self._grabbed_at = grabbed_at
+                    # Skipping the BGR conversion is the cheap part of dropping a frame
+                    skip = self._stats["grabbed"] % self.decode_every and not self._waiting
+                    if skip:
+                        self._stats["skipped"] += 1
+                        self._stale = True
+                if skip:
+                    metrics.FRAMES_DROPPED.inc(stream="capture")
+                else:
+                    success, frame = capture.retrieve()
+                    if success:
+                        with self._cond:
+                            self._seq += 1
+                            self._stats["decoded"] += 1
+                            self._frames.append((self._seq, frame, time.monotonic()))
+                            self._stale = False
+                            self._cond.notify_all()
+                        metrics.FRAMES.inc(stream="capture")
+                if interval:
+                    due += interval
+                    time.sleep(max(0.0, due - time.monotonic()))
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+            self._connected = False
+            if self._capture is not None:
+                self._capture.release()
+
+
+def acquire(source, buffer_size=DEFAULT_BUFFER_SIZE, width=None, height=None, decode_every=None):
+    """Return the running worker for ``source``, starting it if needed.
+
+    ``width``, ``height`` and ``decode_every`` default to CAPTURE_WIDTH,
+    CAPTURE_HEIGHT and CAPTURE_DECODE_EVERY and only apply when the device
+    is opened here. Returns None if the device cannot be opened.
+
+    Opening a device can take seconds, so it happens under a per-source
+    lock; callers using other sources are not held up.
+    """
+    with _workers_lock:
+        worker = _running(source)
+        if worker is not None:
+            return worker
+        opening = _opening.setdefault(source, threading.Lock())
+    with opening:
+        with _workers_lock:
+            worker = _running(source)  # Opened by another caller while we waited
+            if worker is not None:
+                return worker
+        worker = CaptureWorker(
+            source, buffer_size, width or CAPTURE_WIDTH, height or CAPTURE_HEIGHT,
+            decode_every or DECODE_EVERY,
+        )
+        if not worker.start():
+            return None
+        with _workers_lock:
+            _workers[source] = worker
+            worker._refs += 1
+        return worker
+
+
+def _running(source):
+    """Take a reference on the open worker for ``source``; call with _workers_lock held."""
+    worker = _workers.get(source)
+    if worker is None or not worker.is_opened:
+        return None
+    worker._refs += 1
+    return worker
+
+
+def stats():
+    """``stats()`` of every running capture worker."""
+    with _workers_lock:
+        workers = list(_workers.values())
+    return [worker.stats() for worker in workers]
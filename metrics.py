@@ -0,0 +1,314 @@
+"""Process-local latency histograms and counters in Prometheus text format.
+
+    with metrics.timed("match"):
+        results = face_index.match(encodings)
+
+The web apps serve ``render()`` on /metrics; the desktop clients can call
+``start_http_server()`` (set METRICS_PORT). ``profiler`` is a sampling
+profiler that can be switched on and off at runtime and reports collapsed
+stacks for flame graphs.
+"""
+import bisect
+import collections
+import contextlib
+import http.server
+import os
+import sys
+import threading
+import time
+
+# Seconds; covers a sub-millisecond cache hit up to a slow CNN detection
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = collections.defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_label_text(self.label_names, key)} {value}" for key, value in values.items()]
+
+
+class Gauge(_Metric):
+    """A value that is set directly, or read from ``fn`` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), fn=None):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        self._fns = {(): fn} if fn is not None else {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        with self._lock:
+            self._fns[self._key(labels)] = fn
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+            fns = dict(self._fns)
+        for key, fn in fns.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue  # A broken callback must not break the whole scrape
+        return [f"{self.name}{_label_text(self.label_names, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = {}  # key -> [per-bucket counts..., +Inf count]
+        self._sums = collections.defaultdict(float)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            counts = {key: list(value) for key, value in self._counts.items()}
+            sums = dict(self._sums)
+        lines = []
+        for key, bucket_counts in counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_label_text(self.label_names, key, [('le', le)])} {cumulative}")
+            labels = _label_text(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {sums[key]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# Shared metrics for the recognition path and the streaming loops
+STAGE_SECONDS = Histogram(
+    "attendance_stage_seconds", "Time spent in each stage of capture, recognition and check-in.", ("stage",)
+)
+FRAMES = Counter("attendance_frames_total", "Frames processed by each streaming loop.", ("stream",))
+FRAMES_DROPPED = Counter(
+    "attendance_frames_dropped_total", "Frames a streaming loop skipped or was too slow to show.", ("stream",)
+)
+QUEUE_DEPTH = Gauge("attendance_queue_depth", "Items waiting in each internal queue.", ("queue",))
+CHECKINS = Counter("attendance_checkins_total", "Check-ins by outcome.", ("result",))
+CAPTURE_RECONNECTS = Counter("attendance_capture_reconnects_total", "Reconnects after a stream dropped.", ("source",))
+FRAME_AGE = Histogram(
+    "attendance_frame_age_seconds", "Age of capture frames when a consumer picks them up.", ("source",)
+)
+
+
+def timed(stage):
+    """Context manager recording one stage's duration in STAGE_SECONDS."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+class FrameClock:
+    """Frame counter for a display loop that should run at ``fps``.
+
+    Frames that arrive later than one interval after the previous one
+    count as dropped, one per missed interval.
+    """
+
+    def __init__(self, stream, fps):
+        self.stream = stream
+        self.interval = 1.0 / fps
+        self._last = None
+
+    def tick(self):
+        now = time.perf_counter()
+        if self._last is not None:
+            missed = int((now - self._last) / self.interval) - 1
+            if missed > 0:
+                FRAMES_DROPPED.inc(missed, stream=self.stream)
+        self._last = now
+        FRAMES.inc(stream=self.stream)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class SamplingProfiler:
+    """Periodically samples every thread's Python stack.
+
+    Costs nothing while stopped; while running, one background thread wakes
+    every ``interval`` seconds. ``collapsed()`` returns ``frame;frame;... count``
+    lines, the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._stacks = collections.Counter()
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None
+
+    def start(self, interval=None):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if interval:
+                self.interval = interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout=2)
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+
+    def collapsed(self):
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                sampled.append(";".join(reversed(stack)))
+            with self._lock:
+                self._stacks.update(sampled)
+                self._samples += 1
+
+
+profiler = SamplingProfiler()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics/profiler"):
+            body, content_type = profiler.collapsed().encode("utf-8"), "text/plain; charset=utf-8"
+        elif self.path.startswith("/metrics"):
+            body, content_type = render().encode("utf-8"), CONTENT_TYPE
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port=None):
+    """Serve /metrics from a background thread, e.g. for the desktop clients.
+
+    ``port`` defaults to METRICS_PORT; nothing is started if neither is set.
+    """
+    port = port or int(os.getenv("METRICS_PORT", 0))
+    if not port:
+        return None
+    server = http.server.ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+if os.getenv("PROFILER") == "1":
+    profiler.start()
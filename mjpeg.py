@@ -0,0 +1,250 @@
+import asyncio
+import threading
+import time
+import weakref
+
+import cv2
+
+import frame_source
+import metrics
+
+DEFAULT_QUALITY = 80
+
+# Broadcasters by source, shared by every /video_feed viewer of that source
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+_starting = {}  # source -> lock held while its broadcaster opens the camera
+
+metrics.QUEUE_DEPTH.set_function(
+    lambda: sum(broadcaster._subscribers for broadcaster in list(_broadcasters.values())), queue="video_viewers"
+)
+
+
+class MjpegBroadcaster:
+    """Encodes each captured frame once and fans the JPEG out to all viewers.
+
+    Every viewer only ever gets the newest encoded frame: a slow client
+    skips the frames it missed instead of queueing them, and ``max_fps``
+    caps how often an individual viewer is sent a frame.
+    """
+
+    def __init__(self, source, quality=DEFAULT_QUALITY, max_width=None):
+        self.source = source
+        self.quality = quality
+        self.max_width = max_width
+        self._cond = threading.Condition()
+        self._part = None
+        self._seq = 0
+        self._subscribers = 0
+        self._waiters = []  # (loop, future) of async viewers waiting for a frame
+        self._running = False
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._running
+
+    def start(self):
+        worker = frame_source.acquire(self.source)
+        if worker is None:
+            return False
+        self._running = True
+        self._thread = threading.Thread(target=self._run, args=(worker,), name=f"mjpeg-{frame_source.source_name(self.source)}", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._wake_waiters()
+
+    def frames(self, max_fps=None):
+        """Return a generator of multipart MJPEG parts for one viewer until it disconnects.
+
+        It owns the viewer's subscription and drops it when it finishes, is
+        closed, or is discarded without ever being iterated.
+        """
+        release = _Release(self)
+        return _owning(self._frames(max_fps, release), release)
+
+    def aframes(self, max_fps=None):
+        """Async version of ``frames()`` for ASGI servers.
+
+        Waiting viewers are futures on the event loop rather than blocked
+        threads, so an idle viewer costs almost nothing.
+        """
+        release = _Release(self)
+        return _owning(self._aframes(max_fps, release), release)
+
+    def _frames(self, max_fps, release):
+        min_interval = 1.0 / max_fps if max_fps else 0.0
+        seq = 0
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq != seq or not self._running, timeout=1.0)
+                    if self._seq == seq:
+                        if not self._running:
+                            break
+                        continue
+                    if seq:
+                        metrics.FRAMES_DROPPED.inc(self._seq - seq - 1, stream="video_feed")
+                    seq, part = self._seq, self._part
+                metrics.FRAMES.inc(stream="video_feed")
+                sent_at = time.monotonic()
+                yield part
+                if min_interval:
+                    remaining = min_interval - (time.monotonic() - sent_at)
+                    if remaining > 0:
+                        time.sleep(remaining)
+        finally:
+            release()
+
+    async def _aframes(self, max_fps, release):
+        loop = asyncio.get_running_loop()
+        min_interval = 1.0 / max_fps if max_fps else 0.0
+        seq = 0
+        try:
+            while True:
+                waiter = None
+                with self._cond:
+                    if self._seq == seq:
+                        if not self._running:
+                            break
+                        waiter = loop.create_future()
+                        self._waiters.append((loop, waiter))
+                    else:
+                        if seq:
+                            metrics.FRAMES_DROPPED.inc(self._seq - seq - 1, stream="video_feed")
+                        seq, part = self._seq, self._part
+                if waiter is not None:
+                    try:
+                        await asyncio.wait_for(waiter, timeout=1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                metrics.FRAMES.inc(stream="video_feed")
+                sent_at = loop.time()
+                yield part
+                if min_interval:
+                    remaining = min_interval - (loop.time() - sent_at)
+                    if remaining > 0:
+                        await asyncio.sleep(remaining)
+        finally:
+            release()
+
+    def _wake_waiters(self):
+        with self._cond:
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                pass  # That viewer's event loop has been closed
+
+    def _encode(self, frame):
+        if self.max_width and frame.shape[1] > self.max_width:
+            height = int(frame.shape[0] * self.max_width / frame.shape[1])
+            frame = cv2.resize(frame, (self.max_width, height), interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return (b"--frame\r\n"
+                b"Content-Type: image/jpeg\r\n\r\n" + buffer.tobytes() + b"\r\n")
+
+    def _run(self, worker):
+        try:
+            seq = None
+            while self._running:
+                seq, frame = worker.wait_for_frame(seq, timeout=1.0)
+                if frame is None:
+                    if not worker.is_opened:
+                        break
+                    continue
+                with metrics.timed("jpeg_encode"):
+                    part = self._encode(frame)
+                with self._cond:
+                    self._part = part
+                    self._seq += 1
+                    self._cond.notify_all()
+                self._wake_waiters()
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+            self._wake_waiters()
+            worker.release()
+
+
+class _Release:
+    """Drops one viewer's subscription, at most once however often it is called."""
+
+    def __init__(self, broadcaster):
+        self._broadcaster = broadcaster
+        self._lock = threading.Lock()
+        self._done = False
+
+    def __call__(self):
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+        _unsubscribe(self._broadcaster)
+
+
+def _owning(generator, release):
+    # A generator that is never started does not run its finally block, e.g.
+    # when the client leaves before the response is streamed; release then
+    # happens when the generator is garbage collected.
+    weakref.finalize(generator, release)
+    return generator
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def subscribe(source, quality=DEFAULT_QUALITY, max_width=None):
+    """Register a viewer for ``source`` and return its broadcaster.
+
+    Iterate ``broadcaster.frames()`` (or ``aframes()`` on an event loop) to
+    stream; the subscription ends when that generator is closed. Returns
+    None if the camera cannot be opened. The camera is opened under a
+    per-source lock, so viewers of other cameras are not held up.
+    """
+    with _broadcasters_lock:
+        broadcaster = _running(source)
+        if broadcaster is not None:
+            return broadcaster
+        starting = _starting.setdefault(source, threading.Lock())
+    with starting:
+        with _broadcasters_lock:
+            broadcaster = _running(source)  # Started by another viewer while we waited
+            if broadcaster is not None:
+                return broadcaster
+        broadcaster = MjpegBroadcaster(source, quality, max_width)
+        if not broadcaster.start():
+            return None
+        with _broadcasters_lock:
+            _broadcasters[source] = broadcaster
+            broadcaster._subscribers += 1
+        return broadcaster
+
+
+def _running(source):
+    """Add a viewer to the running broadcaster for ``source``; call with _broadcasters_lock held."""
+    broadcaster = _broadcasters.get(source)
+    if broadcaster is None or not broadcaster.is_running:
+        return None
+    broadcaster._subscribers += 1
+    return broadcaster
+
+
+def _unsubscribe(broadcaster):
+    with _broadcasters_lock:
+        broadcaster._subscribers -= 1
+        if broadcaster._subscribers > 0:
+            return
+        if _broadcasters.get(broadcaster.source) is broadcaster:
+            del _broadcasters[broadcaster.source]
+    broadcaster.stop()
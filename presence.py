@@ -0,0 +1,136 @@
+import datetime
+import threading
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+import attendance_events
+
+POLL_INTERVAL = 30.0  # Seconds between refreshes when change streams are unavailable
+RETRY_INTERVAL = 10.0  # Seconds to wait after a failed refresh
+
+
+class PresenceCache:
+    """Process-local set of the people marked present today.
+
+    Duplicate check-ins are answered from memory instead of the database.
+    ``start()`` warms the set from the indexed (day, status) query and keeps
+    it in step with other workers: through a change stream on the events
+    collection when MongoDB runs as a replica set, otherwise by re-running
+    the query every ``poll_interval`` seconds. The set empties itself when
+    the day changes.
+    """
+
+    def __init__(self, db_fn=None, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._db_fn = db_fn
+        self._day = self._today()
+        self._names = set()
+        self._warmed = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_warm(self):
+        return self._warmed
+
+    def is_marked(self, name, when=None):
+        day = when.strftime(attendance_events.DAY_FORMAT) if when else self._today()
+        with self._lock:
+            self._roll_over()
+            return day == self._day and name in self._names
+
+    def add(self, name, when=None, day=None):
+        day = day or (when.strftime(attendance_events.DAY_FORMAT) if when else self._today())
+        with self._lock:
+            self._roll_over()
+            if day == self._day:
+                self._names.add(name)
+
+    def __len__(self):
+        with self._lock:
+            self._roll_over()
+            return len(self._names)
+
+    def warm(self):
+        """Load today's present names from MongoDB; returns how many there are."""
+        day = self._today()
+        names = self._get_db()[attendance_events.EVENTS_COLLECTION].distinct(
+            "name", {"day": day, "status": "present"}
+        )
+        with self._lock:
+            self._roll_over()
+            if day == self._day:
+                self._names.update(names)
+                self._warmed = True
+            return len(self._names)
+
+    def start(self):
+        """Warm and follow changes on a background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="presence-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _today(self):
+        return datetime.date.today().strftime(attendance_events.DAY_FORMAT)
+
+    def _roll_over(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._names.clear()
+            self._warmed = False
+
+    def _get_db(self):
+        if self._db_fn is None:
+            import repository
+
+            return repository.get_db()
+        return self._db_fn()
+
+    def _run(self):
+        use_change_stream = True
+        while not self._stop.is_set():
+            try:
+                if use_change_stream:
+                    self._follow_changes()
+                else:
+                    self.warm()
+                    self._stop.wait(self.poll_interval)
+            except OperationFailure as e:
+                if use_change_stream:
+                    # Standalone servers have no change streams; poll instead
+                    print(f"ℹ️ Change streams unavailable, refreshing presence every {self.poll_interval:.0f}s: {e}")
+                    use_change_stream = False
+                else:
+                    self._stop.wait(RETRY_INTERVAL)
+            except PyMongoError:
+                # Offline: keep answering from memory and re-warm once reachable
+                self._stop.wait(RETRY_INTERVAL)
+
+    def _follow_changes(self):
+        pipeline = [{"$match": {
+            "operationType": {"$in": ["insert", "update", "replace"]},
+            "fullDocument.status": "present",
+        }}]
+        events = self._get_db()[attendance_events.EVENTS_COLLECTION]
+        # Open the stream before warming so nothing written in between is missed
+        with events.watch(pipeline, full_document="updateLookup", max_await_time_ms=1000) as stream:
+            self.warm()
+            while not self._stop.is_set() and self._warmed:
+                change = stream.try_next()
+                if change is None:
+                    with self._lock:
+                        self._roll_over()  # Leaves the loop at midnight to warm the new day
+                    continue
+                event = change.get("fullDocument") or {}
+                if event.get("name"):
+                    self.add(event["name"], day=event.get("day"))
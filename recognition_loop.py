@@ -0,0 +1,296 @@
+import asyncio
+import datetime
+import json
+import queue
+import threading
+import time
+
+import frame_source
+import metrics
+from presence import PresenceCache
+from detection import config_for
+from recognition_service import TimeoutError
+
+DEFAULT_RATE = 2.0  # Recognition passes per second
+DEFAULT_COOLDOWN = 30.0  # Seconds between repeated events for the same person
+
+
+class SeenToday:
+    """Per-person debounce for the hands-free loop.
+
+    People already marked today are answered from ``presence`` (a
+    presence.PresenceCache, shared with the check-in path), so the database
+    is hit once per person per day rather than once per frame. ``cooldown``
+    additionally rate limits repeat events for the same face.
+    """
+
+    def __init__(self, cooldown=DEFAULT_COOLDOWN, presence=None):
+        self.cooldown = cooldown
+        self.presence = presence if presence is not None else PresenceCache()
+        self._last_event = {}
+        self._lock = threading.Lock()
+
+    def is_marked(self, name):
+        return self.presence.is_marked(name)
+
+    def add(self, name):
+        self.presence.add(name)
+
+    def should_announce(self, name):
+        """Return True at most once per cooldown period for ``name``."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_event.get(name)
+            if last is not None and now - last < self.cooldown:
+                return False
+            self._last_event[name] = now
+            return True
+
+
+class EventBus:
+    """Fan-out of recognition events to server-sent-event subscribers."""
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self._subscribers), queue="recognition_event_subscribers")
+
+    def publish(self, event):
+        data = json.dumps(event)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            if isinstance(q, tuple):
+                # Async subscriber: hand the event over on its own event loop
+                loop, q = q
+                try:
+                    loop.call_soon_threadsafe(_offer, q, data)
+                except RuntimeError:
+                    pass  # Its event loop has been closed
+            else:
+                _offer(q, data)
+
+    def stream(self, keepalive=15.0):
+        """Yield ``text/event-stream`` chunks until the client disconnects."""
+        q = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subscribers.add(q)
+        try:
+            while True:
+                try:
+                    data = q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {data}\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(q)
+
+    async def astream(self, keepalive=15.0):
+        """Async version of ``stream()`` for ASGI servers."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.max_pending))
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(subscriber[1].get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {data}\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+def _offer(q, data):
+    try:
+        q.put_nowait(data)
+    except (queue.Full, asyncio.QueueFull):
+        # Slow client; it will catch up on the next event
+        metrics.FRAMES_DROPPED.inc(stream="recognition_events")
+
+
+class RecognitionLoop:
+    """Runs detection and matching off one or more capture streams at a fixed rate.
+
+    ``cameras`` maps a camera ID to its source (webcam index or RTSP URL).
+    On each pass the newest frame from every camera is sent to
+    ``recognition_service`` for detection and encoding: CNN cameras with
+    same-size frames go as one batch, the rest in parallel, one job per
+    frame. The faces found are matched in a single FaceIndex lookup. Every recognized
+    face is passed to ``mark_fn(name, camera_id)``, which returns a
+    ``(status, message)`` pair; results are published on ``events``.
+    """
+
+    def __init__(self, cameras, recognition_service, face_index, mark_fn, events, face_store=None,
+                 rate=DEFAULT_RATE, seen=None, timeout=None):
+        self.cameras = dict(cameras)
+        self.recognition_service = recognition_service
+        self.face_index = face_index
+        self.face_store = face_store
+        self.mark_fn = mark_fn
+        self.events = events
+        self.rate = rate
+        self.seen = seen or SeenToday()
+        self.timeout = timeout or 2.0 / rate  # A pass may overrun its slot, but not by much
+        self._workers = {}
+        self._configs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        for camera_id, source in self.cameras.items():
+            self._open(camera_id, source)
+        if not self._workers:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="recognition-loop", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+        with self._lock:
+            workers, self._workers = self._workers, {}
+        for worker in workers.values():
+            worker.release()
+
+    def add_camera(self, camera_id, source):
+        """Start recognizing on another camera; returns False if it cannot be opened."""
+        self.remove_camera(camera_id)
+        self.cameras[camera_id] = source
+        return self._open(camera_id, source)
+
+    def remove_camera(self, camera_id):
+        self.cameras.pop(camera_id, None)
+        with self._lock:
+            worker = self._workers.pop(camera_id, None)
+        if worker is not None:
+            worker.release()
+
+    def process_frames(self, frames):
+        """Recognize every face in ``{camera_id: frame}`` and mark new arrivals."""
+        jobs = self._submit(frames)
+        deadline = time.monotonic() + self.timeout
+
+        seen_on = []
+        face_encodings = []
+        for camera_ids, job, batched in jobs:
+            try:
+                results = job.result(timeout=max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                job.cancel()
+                metrics.FRAMES_DROPPED.inc(len(camera_ids), stream="recognition")
+                continue
+            except Exception as e:
+                print(f"❌ Recognition failed on camera {', '.join(map(str, camera_ids))}: {e}")
+                metrics.FRAMES_DROPPED.inc(len(camera_ids), stream="recognition")
+                continue
+            for camera_id, (_, encodings) in zip(camera_ids, results if batched else [results]):
+                face_encodings.extend(encodings)
+                seen_on.extend([camera_id] * len(encodings))
+        if not face_encodings:
+            return
+
+        if self.face_store is not None:
+            self.face_store.sync(self.face_index)
+        with metrics.timed("match"):
+            matches = self.face_index.match(face_encodings)
+        for camera_id, (name, distance) in zip(seen_on, matches):
+            if name is None or not self.seen.should_announce(name):
+                continue
+            if self.seen.is_marked(name):
+                status, message = "info", f"Attendance already marked for {name} today."
+            else:
+                try:
+                    status, message = self.mark_fn(name, camera_id)
+                except Exception as e:
+                    print(f"❌ Failed to mark attendance for {name}: {e}")
+                    continue
+                if status in ("success", "info"):
+                    self.seen.add(name)
+            self.events.publish({
+                "name": name,
+                "camera_id": camera_id,
+                "status": status,
+                "message": message,
+                "distance": round(distance, 3),
+                "time": datetime.datetime.now().strftime("%H:%M:%S"),
+            })
+
+    def _submit(self, frames):
+        """Queue recognition jobs; returns ``[(camera_ids, future, batched)]``.
+
+        Same-size frames from CNN cameras share one batched job on a single
+        worker; anything else, HOG included, gets a job per frame so the
+        workers handle them in parallel.
+        """
+        groups = {}
+        for camera_id, frame in frames.items():
+            config = self._configs.get(camera_id)
+            key = frame.shape if config is not None and config.model == "cnn" else camera_id
+            groups.setdefault(key, []).append(camera_id)
+
+        jobs = []
+        for camera_ids in groups.values():
+            configs = [self._configs.get(camera_id) for camera_id in camera_ids]
+            try:
+                if len(camera_ids) > 1:
+                    job = self.recognition_service.submit_batch([frames[camera_id] for camera_id in camera_ids], configs)
+                    jobs.append((camera_ids, job, True))
+                else:
+                    jobs.append((camera_ids, self.recognition_service.submit(frames[camera_ids[0]], configs[0]), False))
+            except Exception as e:
+                # e.g. BrokenProcessPool: the service restarts itself, so skip these frames this pass
+                print(f"❌ Recognition failed on camera {', '.join(map(str, camera_ids))}: {e}")
+                metrics.FRAMES_DROPPED.inc(len(camera_ids), stream="recognition")
+        return jobs
+
+    def _open(self, camera_id, source):
+        worker = frame_source.acquire(source)
+        if worker is None:
+            print(f"❌ Failed to open camera {camera_id} ({source}).")
+            return False
+        with self._lock:
+            self._workers[camera_id] = worker
+            self._configs[camera_id] = config_for(source)
+        return True
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        last_seq = {}
+        while not self._stop.is_set():
+            started = time.monotonic()
+            frames = {}
+            with self._lock:
+                workers = list(self._workers.items())
+            for camera_id, worker in workers:
+                if not worker.is_opened:
+                    print(f"❌ Lost camera {camera_id}.")
+                    self.remove_camera(camera_id)
+                    continue
+                seq, frame = worker.wait_for_frame(last_seq.get(camera_id), timeout=0)
+                if frame is not None:
+                    last_seq[camera_id] = seq
+                    frames[camera_id] = frame
+            if frames and self.recognition_service.is_ready:
+                with metrics.timed("recognition_pass"):
+                    self.process_frames(frames)
+                metrics.FRAMES.inc(len(frames), stream="recognition")
+            elapsed = time.monotonic() - started
+            if elapsed > interval:
+                # Passes that overran their slot; those passes' frames were never looked at
+                metrics.FRAMES_DROPPED.inc(int(elapsed / interval), stream="recognition")
+            self._stop.wait(max(0.0, interval - elapsed))
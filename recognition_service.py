@@ -0,0 +1,244 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import metrics
+
+DEFAULT_TIMEOUT = 10.0  # Seconds an HTTP handler waits for a recognition job
+
+__all__ = ["BrokenProcessPool", "RecognitionService", "TimeoutError"]
+
+
+def _init_worker():
+    # Loads the dlib detector, landmark and encoder models once per worker
+    # instead of once per job; a no-op when they came with the fork.
+    from detection import load_models
+
+    load_models()
+
+
+def _read_rgb(shm_name, shape, dtype):
+    import cv2
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        # cvtColor copies, so the shared buffer is released before the slow part
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        del frame
+    finally:
+        shm.close()
+    return rgb_frame
+
+
+def _detect_and_encode(frames, configs):
+    from detection import detect_faces, encode_faces
+
+    (shm_name, shape, dtype), = frames
+    started = time.perf_counter()
+    rgb_frame = _read_rgb(shm_name, shape, dtype)
+    converted = time.perf_counter()
+    face_locations = detect_faces(rgb_frame, configs[0])
+    detected = time.perf_counter()
+    face_encodings = encode_faces(rgb_frame, face_locations)
+    # Stage timings travel back with the result; metrics live in the parent
+    timings = {
+        "bgr_to_rgb": converted - started,
+        "face_locations": detected - converted,
+        "face_encodings": time.perf_counter() - detected,
+    }
+    return (face_locations, face_encodings), timings
+
+
+def _detect_and_encode_batch(frames, configs):
+    from detection import detect_faces_batch, encode_faces
+
+    started = time.perf_counter()
+    rgb_frames = [_read_rgb(*frame) for frame in frames]
+    converted = time.perf_counter()
+    batch_locations = detect_faces_batch(rgb_frames, configs)
+    detected = time.perf_counter()
+    results = [
+        (face_locations, encode_faces(rgb_frame, face_locations))
+        for rgb_frame, face_locations in zip(rgb_frames, batch_locations)
+    ]
+    timings = {
+        "bgr_to_rgb": converted - started,
+        "face_locations": detected - converted,
+        "face_encodings": time.perf_counter() - detected,
+    }
+    return results, timings
+
+
+class RecognitionService:
+    """Face detection and encoding on a pool of worker processes.
+
+    Frames are handed over through shared memory rather than pickled. The
+    dlib models are loaded once, before the workers fork, so they share
+    them. ``submit()`` returns a future of ``(face_locations,
+    face_encodings)``; ``recognize()`` waits for it with a timeout.
+    ``submit_batch()`` sends several frames, e.g. one per camera, to a
+    single worker so CNN detection can run them as one dlib batch.
+    Worker-side stage timings are recorded in ``metrics.STAGE_SECONDS``.
+
+    If a worker dies, jobs fail with BrokenProcessPool and the pool is
+    rebuilt in the background; ``is_ready`` is False until it is back.
+    """
+
+    def __init__(self, workers=None, start_method=None):
+        self.workers = workers or os.cpu_count() or 1
+        # fork shares the already-imported modules with the workers; spawn
+        # would re-run the importing script's module-level setup in each one.
+        start_method = start_method or ("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+        self._context = multiprocessing.get_context(start_method)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._executor_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._free_buffers = {}
+        self._pending = 0
+        metrics.QUEUE_DEPTH.set_function(lambda: self._pending, queue="recognition_jobs")
+
+    @property
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def start(self, wait=True):
+        """Load the models and start all worker processes now rather than on the first job.
+
+        With ``wait=False`` this happens on a background thread; jobs
+        submitted in the meantime wait for it.
+        """
+        if not wait:
+            threading.Thread(target=self.start, name="recognition-startup", daemon=True).start()
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        self._ready.set()
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        self._ready.clear()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._release_buffers()
+
+    def submit(self, frame, config=None):
+        """Queue detection and encoding of a BGR ``frame``."""
+        return self._submit(_detect_and_encode, [frame], [config])
+
+    def submit_batch(self, frames, configs):
+        """Queue several BGR frames as one job; a future of ``[(face_locations, face_encodings)]``.
+
+        Frames using the CNN model whose prepared images share a size are
+        detected in one batched dlib call on the worker.
+        """
+        return self._submit(_detect_and_encode_batch, frames, configs)
+
+    def _submit(self, fn, frames, configs):
+        buffers, handles = [], []
+        for frame in frames:
+            frame = np.ascontiguousarray(frame)
+            shm = self._take_buffer(frame.nbytes)
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf)[...] = frame
+            buffers.append((shm, frame.nbytes))
+            handles.append((shm.name, frame.shape, frame.dtype.str))
+        executor = self._get_executor()
+        try:
+            job = executor.submit(fn, handles, list(configs))
+        except BrokenProcessPool:
+            for shm, size in buffers:
+                self._return_buffer(shm, size)
+            self._restart(executor)
+            raise
+        submitted = time.perf_counter()
+        with self._lock:
+            self._pending += 1
+        future = Future()
+
+        def finish(job):
+            for shm, size in buffers:
+                self._return_buffer(shm, size)
+            with self._lock:
+                self._pending -= 1
+            if future.cancelled():
+                return  # The caller gave up waiting
+            try:
+                result, timings = job.result()
+            except BaseException as e:
+                if isinstance(e, BrokenProcessPool):
+                    self._restart(executor)
+                future.set_exception(e)
+                return
+            for stage, seconds in timings.items():
+                metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - submitted, stage="recognition_job")
+            future.set_result(result)
+
+        job.add_done_callback(finish)
+        return future
+
+    def recognize(self, frame, config=None, timeout=DEFAULT_TIMEOUT):
+        """Return ``(face_locations, face_encodings)``; raises TimeoutError or BrokenProcessPool."""
+        return self.submit(frame, config).result(timeout=timeout)
+
+    def map(self, fn, iterable, chunksize=1):
+        """Run a picklable ``fn`` over ``iterable`` on the workers, in order."""
+        return self._get_executor().map(fn, iterable, chunksize=chunksize)
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                if self._context.get_start_method() == "fork":
+                    # Loaded once here and shared copy-on-write with every worker.
+                    # Holding the lock meanwhile keeps other threads from forking
+                    # while the import is half done.
+                    _init_worker()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=self._context, initializer=_init_worker
+                )
+            return self._executor
+
+    def _restart(self, broken):
+        """Replace ``broken`` with a fresh pool and fresh buffers, once per broken pool."""
+        with self._executor_lock:
+            if self._executor is not broken:
+                return  # Already replaced by another failed job
+            self._executor = None
+            self._ready.clear()
+        print("⚠️ A recognition worker died; restarting the pool.")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._release_buffers()
+        self.start(wait=False)
+
+    def _release_buffers(self):
+        with self._lock:
+            buffers = [shm for pool in self._free_buffers.values() for shm in pool]
+            self._free_buffers.clear()
+        for shm in buffers:
+            shm.close()
+            shm.unlink()
+
+    def _take_buffer(self, size):
+        with self._lock:
+            pool = self._free_buffers.get(size)
+            if pool:
+                return pool.pop()
+        return shared_memory.SharedMemory(create=True, size=size)
+
+    def _return_buffer(self, shm, size):
+        with self._lock:
+            pool = self._free_buffers.setdefault(size, [])
+            if len(pool) < self.workers:
+                pool.append(shm)
+                return
+        shm.close()
+        shm.unlink()
@@ -3,46 +3,159 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
 from kivy.uix.label import Label
-from kivy.clock import Clock
+from kivy.clock import Clock, mainthread
 from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
 import cv2
-import face_recognition
+import numpy as np
 import os
-import pickle
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import threading
 from dotenv import load_dotenv
 import os
 from kivy.graphics.texture import Texture  # Import Texture for video rendering
 import datetime  # Import datetime for attendance marking
 from kivy.uix.popup import Popup  # Import Popup for displaying messages
+import enrolment
+import frame_source
+import metrics
+from warmup import Warmup
+from checkin_queue import CheckinQueue
+from presence import PresenceCache
+from face_index import FaceIndex
+from face_store import FaceStore
+from tracker import FaceTracker
+from detection import config_for, detect_faces, encode_faces, load_models
 
 # Load environment variables
 load_dotenv()
-MONGO_CONNECTION_STRING = os.getenv("MONGO_CONNECTION_STRING")
-
-# MongoDB connection setup
-try:
-    client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
-    db = client["attendanceDB"]
-    attendance_collection = db["attendance"]
-    client.server_info()  # Test the connection
-    print("✅ Connected to MongoDB Atlas successfully.")
-except ConnectionFailure as e:
-    print(f"❌ Error connecting to MongoDB Atlas: {e}")
-    attendance_collection = None
 
 # File paths
-FACE_DATA_FILE = "faces.pkl"
+FACE_STORE_PATH = "faces"  # faces.f32 + faces.names, see face_store.py
 FACES_DIR = "faces"
 os.makedirs(FACES_DIR, exist_ok=True)
 
 # Load stored face data
-known_face_encodings = []
-known_face_names = []
-if os.path.exists(FACE_DATA_FILE):
-    with open(FACE_DATA_FILE, "rb") as f:
-        known_face_encodings, known_face_names = pickle.load(f)
+face_store = FaceStore(FACE_STORE_PATH)
+face_index = FaceIndex()
+
+# The window opens straight away; the dlib models and the gallery load behind it
+warmup = Warmup()
+warmup.add("models", load_models)
+warmup.add("gallery", lambda: face_store.sync(face_index))
+warmup.start()
+
+# Check-ins are queued locally and replayed into MongoDB in the background
+presence = PresenceCache()  # Repeat sightings today are answered from memory
+presence.start()
+checkin_queue = CheckinQueue(presence=presence)
+checkin_queue.start()
+metrics.start_http_server()  # Only if METRICS_PORT is set
+
+FRAME_TIMEOUT = 2.0  # Seconds to wait for a frame from the webcam
+
+class CameraPreview:
+    """Webcam preview drawn into ``widget``'s texture at the camera's rate.
+
+    Frames come from a frame_source capture worker. Face detection and
+    tracking run on their own thread against the newest frame, so the Clock
+    callback only draws the latest boxes over the newest frame. The texture
+    and the overlay buffer are allocated once per frame size and updated in
+    place, and the texture is flipped once rather than every frame.
+    """
+
+    def __init__(self, widget, on_lost=None, fps=30):
+        self.widget = widget
+        self.on_lost = on_lost  # Called on the Kivy thread if the webcam stops delivering
+        self.fps = fps
+        self.worker = None
+        self.face_tracker = FaceTracker(face_index, config=config_for(0))
+        self._tracks = []  # (box, name) for the newest tracked frame
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._event = None
+        self._texture = None
+        self._buffer = None
+        self._shown = None
+        self._frame_clock = metrics.FrameClock("kivy", fps)
+
+    @property
+    def is_running(self):
+        return self.worker is not None and self.worker.is_opened
+
+    def start(self):
+        if self.worker is not None:
+            return True
+        self.worker = frame_source.acquire(0)
+        if self.worker is None:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._track, name="kivy-tracking", daemon=True)
+        self._thread.start()
+        self._event = Clock.schedule_interval(self._update, 1.0 / self.fps)
+        return True
+
+    def stop(self):
+        if self._event:
+            Clock.unschedule(self._event)
+            self._event = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self.worker is not None:
+            self.worker.release()
+            self.worker = None
+        self.face_tracker.reset()
+        with self._lock:
+            self._tracks = []
+        self._shown = None
+
+    def _track(self):
+        worker = self.worker
+        seq = None
+        while not self._stop.is_set():
+            seq, frame = worker.wait_for_frame(seq, timeout=0.5)
+            if frame is None:
+                if not worker.is_opened:
+                    break
+                continue
+            # Detect every few frames and track faces in between
+            tracks = [(track.box, track.name) for track in self.face_tracker.update(frame)]
+            with self._lock:
+                self._tracks = tracks
+
+    def _update(self, dt):
+        if not self.is_running:
+            if self.on_lost is not None:
+                self.on_lost()
+            return
+        frame = self.worker.latest()
+        if frame is None or frame is self._shown:
+            return
+        self._shown = frame
+        self._frame_clock.tick()
+        with self._lock:
+            tracks = self._tracks
+
+        with metrics.timed("kivy_display"):
+            height, width = frame.shape[:2]
+            if self._texture is None or self._texture.size != (width, height):
+                self._texture = Texture.create(size=(width, height), colorfmt="bgr")
+                self._texture.flip_vertical()
+                self._buffer = np.empty_like(frame)
+            pixels = frame
+            if tracks:
+                # Capture frames are shared and read-only, so boxes go on our own buffer
+                np.copyto(self._buffer, frame)
+                for (top, right, bottom, left), name in tracks:
+                    cv2.rectangle(self._buffer, (left, top), (right, bottom), (0, 255, 0), 2)
+                    if name is not None:
+                        cv2.putText(self._buffer, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+                pixels = self._buffer
+            self._texture.blit_buffer(pixels.reshape(-1), colorfmt="bgr", bufferfmt="ubyte")
+            if self.widget.texture is not self._texture:
+                self.widget.texture = self._texture
+            self.widget.canvas.ask_update()
 
 class RegisterScreen(BoxLayout):
     def __init__(self, **kwargs):
@@ -73,59 +186,26 @@ class RegisterScreen(BoxLayout):
         self.status_label = Label(text="")
         self.add_widget(self.status_label)
 
-        self.cap = None
-        self.frame_event = None
+        self.preview = CameraPreview(self.video_feed, on_lost=self.on_webcam_lost)
 
     def start_video_feed(self, instance):
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
+        warmup.wait()  # Usually finished long before the first click
+        if not self.preview.start():
             self.status_label.text = "❌ Webcam access failed."
             return
         self.status_label.text = "📸 Starting webcam..."
-        self.frame_event = Clock.schedule_interval(self.update_video_feed, 1.0 / 30)
 
-    def update_video_feed(self, dt):
-        ret, frame = self.cap.read()
-        if not ret:
-            self.status_label.text = "❌ Failed to read from webcam."
-            self.stop_video_feed()
-            return
+    def on_webcam_lost(self):
+        self.status_label.text = "❌ Failed to read from webcam."
+        self.stop_video_feed()
 
-        # Convert frame to RGB for face detection
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-        # Draw bounding boxes and names around detected faces
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-            name = "Stranger"
-            face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-            best_match_index = None
-
-            if True in matches:
-                best_match_index = matches.index(True)
-                name = known_face_names[best_match_index]
-
-            # Draw bounding box
-            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-            # Draw name above the bounding box
-            if best_match_index is not None:
-                cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-        # Convert frame to texture for Kivy
-        buf = cv2.flip(frame, 0).tobytes()
-        texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt="bgr")
-        texture.blit_buffer(buf, colorfmt="bgr", bufferfmt="ubyte")
-        self.video_feed.texture = texture
+    @mainthread
+    def set_status(self, text):
+        self.status_label.text = text
 
+    @mainthread
     def stop_video_feed(self):
-        if self.frame_event:
-            Clock.unschedule(self.frame_event)
-            self.frame_event = None
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        self.preview.stop()
 
     def register_user(self, instance):
         name = self.name_input.text.strip()
@@ -134,33 +214,39 @@ class RegisterScreen(BoxLayout):
             self.status_label.text = "Please fill in all fields."
             return
         self.status_label.text = "Capturing face..."
-        Clock.schedule_once(lambda dt: self.capture_face(name, phone), 0)
+        # Detecting faces in the whole burst takes a while; keep it off the Kivy thread
+        threading.Thread(target=self.capture_face, args=(name, phone), name="enrolment", daemon=True).start()
 
     def capture_face(self, name, phone):
-        if not self.cap or not self.cap.isOpened():
-            self.status_label.text = "❌ Webcam is not active."
+        if not self.preview.is_running:
+            self.set_status("❌ Webcam is not active.")
             return
 
-        ret, frame = self.cap.read()
-        if not ret:
-            self.status_label.text = "Failed to access webcam."
+        # A short burst, so one blurry or badly posed frame does not decide enrolment
+        frames, results = [], []
+        seq = None
+        for _ in range(enrolment.BURST_FRAMES):
+            seq, frame = self.preview.worker.wait_for_frame(seq, timeout=FRAME_TIMEOUT)
+            if frame is None:
+                break
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            face_locations = detect_faces(rgb_frame, config_for(0))
+            frames.append(frame)
+            results.append((face_locations, encode_faces(rgb_frame, face_locations)))
+        if not frames:
+            self.set_status("Failed to access webcam.")
             return
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        if not face_locations:
-            self.status_label.text = "No face detected. Try again."
+        face_encodings, photo, reason = enrolment.pick_samples(frames, results)
+        if not face_encodings:
+            self.set_status(reason)
             return
 
-        face_encoding = face_recognition.face_encodings(rgb_frame, face_locations)[0]
-        known_face_encodings.append(face_encoding)
-        known_face_names.append(name)
-
-        with open(FACE_DATA_FILE, "wb") as f:
-            pickle.dump((known_face_encodings, known_face_names), f)
+        face_store.append_many(face_encodings, [name] * len(face_encodings))
+        face_store.sync(face_index)
 
-        cv2.imwrite(os.path.join(FACES_DIR, f"{name}.jpg"), frame)
-        self.status_label.text = f"{name} registered successfully!"
+        cv2.imwrite(os.path.join(FACES_DIR, f"{name}.jpg"), photo)
+        self.set_status(f"{name} registered successfully!")
         self.stop_video_feed()
 
 class AttendanceScreen(BoxLayout):
@@ -180,100 +266,52 @@ class AttendanceScreen(BoxLayout):
         self.attend_button.bind(on_press=self.start_video_feed)
         self.add_widget(self.attend_button)
 
-        self.cap = None
-        self.frame_event = None
+        self.preview = CameraPreview(self.video_feed, on_lost=self.on_webcam_lost)
 
     def start_video_feed(self, instance):
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
+        warmup.wait()  # Usually finished long before the first click
+        if not self.preview.start():
             self.status_label.text = "❌ Webcam access failed."
             return
         self.status_label.text = "📸 Starting webcam..."
-        self.frame_event = Clock.schedule_interval(self.update_video_feed, 1.0 / 30)
 
-    def update_video_feed(self, dt):
-        ret, frame = self.cap.read()
-        if not ret:
-            self.status_label.text = "❌ Failed to read from webcam."
-            self.stop_video_feed()
-            return
+    def on_webcam_lost(self):
+        self.status_label.text = "❌ Failed to read from webcam."
+        self.stop_video_feed()
 
-        # Convert frame to RGB for face detection
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-        # Draw bounding boxes and names around detected faces
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-            name = "Stranger"
-            face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-            best_match_index = None
-
-            if True in matches:
-                best_match_index = matches.index(True)
-                name = known_face_names[best_match_index]
-
-            # Draw bounding box
-            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-            # Draw name above the bounding box
-            if best_match_index is not None:
-                cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-        # Convert frame to texture for Kivy
-        buf = cv2.flip(frame, 0).tobytes()
-        texture = Texture.create(size=(frame.shape[1], frame.shape[0]), colorfmt="bgr")
-        texture.blit_buffer(buf, colorfmt="bgr", bufferfmt="ubyte")
-        self.video_feed.texture = texture
+    @mainthread
+    def set_status(self, text):
+        self.status_label.text = text
 
+    @mainthread
     def stop_video_feed(self):
-        if self.frame_event:
-            Clock.unschedule(self.frame_event)
-            self.frame_event = None
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        self.preview.stop()
 
     def capture_attendance(self, instance):
-        if not self.cap or not self.cap.isOpened():
-            self.status_label.text = "❌ Webcam is not active."
+        # Recognition runs off the Kivy thread; results come back as popups
+        threading.Thread(target=self.recognize_and_mark, name="attendance", daemon=True).start()
+
+    def recognize_and_mark(self):
+        if not self.preview.is_running:
+            self.set_status("❌ Webcam is not active.")
             return
 
-        ret, frame = self.cap.read()
-        if not ret:
-            self.status_label.text = "Failed to access webcam."
+        frame = self.preview.worker.latest()
+        if frame is None:
+            self.set_status("Failed to access webcam.")
             return
 
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-        for face_encoding in face_encodings:
-            matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-            name = "Stranger"
-            if True in matches:
-                idx = matches.index(True)
-                name = known_face_names[idx]
-
-                # Check if attendance is already marked for today
-                now = datetime.datetime.now()
-                today_date = now.strftime("%Y-%m-%d")
-                record = attendance_collection.find_one({"name": name})
-                if record:
-                    attendance_today = any(
-                        entry.get("date") == today_date for entry in record.get("attendance", [])
-                    )
-                    if attendance_today:
-                        self.show_popup("Attendance Already Marked", f"Attendance already marked for {name} today.")
-                        return
-
-                # Mark attendance for today
-                attendance_entry = {"date": today_date, "status": "present"}
-                attendance_collection.update_one(
-                    {"name": name},
-                    {"$push": {"attendance": attendance_entry}},
-                    upsert=True
-                )
+        face_locations = detect_faces(rgb_frame, config_for(0))
+        face_encodings = encode_faces(rgb_frame, face_locations)
+
+        for name, distance in face_index.match(face_encodings):
+            if name is not None:
+                # Mark attendance for today unless it already is
+                if not checkin_queue.mark_present(name):
+                    self.show_popup("Attendance Already Marked", f"Attendance already marked for {name} today.")
+                    return
+
                 self.show_popup("Attendance Marked", f"✅ Attendance marked for {name}.")
             else:
                 self.show_popup("Unrecognized Face", "⚠️ Unrecognized face. Please register first.")
@@ -282,6 +320,7 @@ class AttendanceScreen(BoxLayout):
         if face_encodings:
             self.stop_video_feed()
 
+    @mainthread
     def show_popup(self, title, message):
         """Display a popup with the given title and message."""
         popup_content = BoxLayout(orientation="vertical")
@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+import threading
+import time
+
+from attendance_events import EVENTS_COLLECTION, PEOPLE_COLLECTION
+
+SORT_FIELDS = ("name", "phone", "status", "time")
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+EXPORT_BATCH_SIZE = 500
+EXPORT_FIELDS = ["name", "phone", "status", "date", "time"]
+
+
+class ReportCache:
+    """Short-lived cache of report pages, cleared on every attendance write."""
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                return None
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _today_lookup(day):
+    # Only that day's present event is joined in, and only its time
+    return {"$lookup": {
+        "from": EVENTS_COLLECTION,
+        "localField": "name",
+        "foreignField": "name",
+        "pipeline": [
+            {"$match": {"day": day, "status": "present"}},
+            {"$project": {"_id": 0, "time": 1}},
+        ],
+        "as": "today",
+    }}
+
+
+_shape_row = [
+    {"$project": {"_id": 0, "name": 1, "phone": 1, "time": {"$first": "$today.time"}}},
+    {"$addFields": {"status": {"$cond": [{"$ifNull": ["$time", False]}, "Present", "Absent"]}}},
+]
+
+
+def report_query(day, page=1, per_page=DEFAULT_PER_PAGE, sort="name", descending=False):
+    """Build the aggregation over the people collection for one report page.
+
+    Returns ``(pipeline, faceted)``. A faceted pipeline yields one document
+    holding the rows and the total (see ``page_result()``); otherwise it
+    yields the rows and the total is the number of people. Shared by the
+    sync and async repositories so both run the same query.
+    """
+    direction = -1 if descending else 1
+    skip = (page - 1) * per_page
+
+    if sort in ("name", "phone"):
+        # Sort and page the people first, then join only this page's events
+        return [
+            {"$sort": {sort: direction, "_id": 1}},
+            {"$skip": skip},
+            {"$limit": per_page},
+            _today_lookup(day),
+            *_shape_row,
+        ], False
+
+    return [
+        {"$project": {"name": 1, "phone": 1}},
+        _today_lookup(day),
+        *_shape_row,
+        {"$sort": {sort: direction, "name": 1}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "rows": [{"$skip": skip}, {"$limit": per_page}],
+        }},
+    ], True
+
+
+def page_result(document):
+    """``(rows, total)`` from the single document a faceted report query returns."""
+    total = document["total"][0]["count"] if document["total"] else 0
+    return document["rows"], total
+
+
+def report_page(db, day, page=1, per_page=DEFAULT_PER_PAGE, sort="name", descending=False):
+    """Return ``(rows, total)`` for one page of the attendance report for ``day``."""
+    people = db[PEOPLE_COLLECTION]
+    pipeline, faceted = report_query(day, page, per_page, sort, descending)
+    if not faceted:
+        return list(people.aggregate(pipeline)), people.count_documents({})
+    return page_result(next(people.aggregate(pipeline)))
+
+
+def iter_report(db, day, batch_size=EXPORT_BATCH_SIZE):
+    """Yield report rows for ``day`` in name order, one batch of people at a time."""
+    cursor = db[PEOPLE_COLLECTION].find({}, {"_id": 0, "name": 1, "phone": 1}).sort("name", 1).batch_size(batch_size)
+    batch = []
+    for person in cursor:
+        batch.append(person)
+        if len(batch) >= batch_size:
+            yield from _join_batch(db, day, batch)
+            batch = []
+    if batch:
+        yield from _join_batch(db, day, batch)
+
+
+def _join_batch(db, day, people):
+    events = db[EVENTS_COLLECTION].find(
+        {"day": day, "status": "present", "name": {"$in": [p.get("name") for p in people]}},
+        {"_id": 0, "name": 1, "time": 1},
+    )
+    times = {event["name"]: event.get("time") for event in events}
+    for person in people:
+        name = person.get("name", "Unknown")
+        present = name in times
+        yield {
+            "name": name,
+            "phone": person.get("phone", "Unknown"),
+            "status": "Present" if present else "Absent",
+            "date": day,
+            "time": times.get(name) or "N/A",
+        }
+
+
+def export_csv(rows):
+    """Stream rows as CSV text chunks."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_json(rows):
+    """Stream rows as a JSON array in chunks."""
+    parts = ["["]
+    for count, row in enumerate(rows):
+        parts.append(("," if count else "") + json.dumps(row))
+        if len(parts) >= EXPORT_BATCH_SIZE:
+            yield "".join(parts)
+            parts = []
+    parts.append("]")
+    yield "".join(parts)
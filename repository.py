@@ -0,0 +1,177 @@
+"""Shared MongoDB access for the web app, the desktop clients and scripts.
+
+The client is created lazily on first use, with pool, timeout and write
+concern settings taken from the environment, and without a blocking ping.
+``AsyncRepository`` offers person registration and report pages on
+Motor for asyncio servers, built with the same query helpers in
+attendance_events and reports. Check-ins do not go through it: both
+front ends write them to the local CheckinQueue, which flushes them with
+this module's sync client.
+"""
+import os
+import threading
+import urllib.parse
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+import attendance_events
+import reports
+import rollups
+
+load_dotenv()
+
+DB_NAME = os.getenv("MONGO_DB_NAME", "attendanceDB")
+
+_client = None
+_indexes_ready = False
+_lock = threading.Lock()
+
+
+def connection_string() -> Optional[str]:
+    """Return the MongoDB URL, filling ``{username}``/``{password}`` placeholders."""
+    url = os.getenv("MONGO_CONNECTION_STRING") or os.getenv("MONGO_STRING")
+    username = os.getenv("MONGO_USERNAME")
+    password = os.getenv("MONGO_PASSWORD")
+    if url and username is not None and password is not None and "{" in url:
+        url = url.format(
+            username=urllib.parse.quote_plus(username),
+            password=urllib.parse.quote_plus(password),
+        )
+    return url
+
+
+def client_options() -> Dict[str, object]:
+    """Pool, timeout and write-concern settings shared by sync and async clients."""
+    return {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_MS", 60000)),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 10000)),
+        "w": int(os.getenv("MONGO_WRITE_CONCERN")) if os.getenv("MONGO_WRITE_CONCERN", "").isdigit()
+        else os.getenv("MONGO_WRITE_CONCERN", "majority"),
+        "retryWrites": True,
+    }
+
+
+def get_client() -> MongoClient:
+    """Return the process-wide client, creating it on first use."""
+    global _client
+    with _lock:
+        if _client is None:
+            # connect=False: no network traffic until the first operation
+            _client = MongoClient(connection_string(), connect=False, **client_options())
+        return _client
+
+
+def get_db():
+    """Return the attendance database, creating indexes on first use."""
+    global _indexes_ready
+    db = get_client()[DB_NAME]
+    if not _indexes_ready:
+        attendance_events.ensure_indexes(db)
+        _indexes_ready = True
+    return db
+
+
+def close() -> None:
+    global _client, _indexes_ready
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _indexes_ready = False
+
+
+def register_person(name: str, phone: str, camera_id: Optional[str] = None) -> bool:
+    """Create or update a person; returns True if they are new."""
+    return attendance_events.register_person(get_db(), name, phone, camera_id=camera_id)
+
+
+def register_people(people: List[Tuple[str, Optional[str]]], camera_id: Optional[str] = None) -> int:
+    """Bulk-create or update ``(name, phone)`` people; returns how many are new."""
+    return attendance_events.register_people(get_db(), people, camera_id=camera_id)
+
+
+def is_registered(name: str) -> bool:
+    return get_db()[attendance_events.PEOPLE_COLLECTION].find_one({"name": name}, {"_id": 1}) is not None
+
+
+def mark_present(name: str, when: Optional[datetime] = None, camera_id: Optional[str] = None,
+                 latitude: Optional[float] = None, longitude: Optional[float] = None) -> bool:
+    """Mark ``name`` present; returns False if they already were today."""
+    return attendance_events.mark_present(get_db(), name, when, camera_id, latitude, longitude)
+
+
+def record_status(name: str, day: str, status: str, **fields) -> None:
+    attendance_events.record_status(get_db(), name, day, status, **fields)
+
+
+def close_out_day(day: Optional[str] = None) -> Dict[str, object]:
+    return attendance_events.close_out_day(get_db(), day)
+
+
+def report_page(day: str, page: int = 1, per_page: int = reports.DEFAULT_PER_PAGE,
+                sort: str = "name", descending: bool = False) -> Tuple[List[dict], int]:
+    return reports.report_page(get_db(), day, page, per_page, sort, descending)
+
+
+def iter_report(day: str) -> Iterator[dict]:
+    return reports.iter_report(get_db(), day)
+
+
+def daily_range(start: str, end: str) -> Dict[str, object]:
+    return rollups.daily_range(get_db(), start, end)
+
+
+def person_range(name: str, start: str, end: str) -> Dict[str, object]:
+    return rollups.person_range(get_db(), name, start, end)
+
+
+class AsyncRepository:
+    """Motor-based twin of ``register_person()`` and ``report_page()``, for asyncio servers."""
+
+    def __init__(self):
+        self._client = None
+        self._indexes_ready = False
+
+    def get_db(self):
+        if self._client is None:
+            # Imported here so the sync clients do not need Motor installed
+            from motor.motor_asyncio import AsyncIOMotorClient
+
+            self._client = AsyncIOMotorClient(connection_string(), connect=False, **client_options())
+        return self._client[DB_NAME]
+
+    async def _ready_db(self):
+        db = self.get_db()
+        if not self._indexes_ready:
+            for collection, keys, options in attendance_events.INDEXES:
+                await db[collection].create_index(keys, **options)
+            self._indexes_ready = True
+        return db
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def register_person(self, name: str, phone: str, camera_id: Optional[str] = None) -> bool:
+        db = await self._ready_db()
+        query, update = attendance_events.person_upsert(name, phone, camera_id=camera_id)
+        result = await db[attendance_events.PEOPLE_COLLECTION].update_one(query, update, upsert=True)
+        return result.upserted_id is not None
+
+    async def report_page(self, day: str, page: int = 1, per_page: int = reports.DEFAULT_PER_PAGE,
+                          sort: str = "name", descending: bool = False) -> Tuple[List[dict], int]:
+        db = await self._ready_db()
+        people = db[attendance_events.PEOPLE_COLLECTION]
+        pipeline, faceted = reports.report_query(day, page, per_page, sort, descending)
+        rows = await people.aggregate(pipeline).to_list(None)
+        if not faceted:
+            return rows, await people.count_documents({})
+        return reports.page_result(rows[0])
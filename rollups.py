@@ -0,0 +1,182 @@
+import calendar
+import os
+import sys
+from datetime import datetime
+
+from pymongo import ASCENDING, UpdateOne
+
+DAILY_COLLECTION = "daily_rollups"  # _id: day, counters for everyone
+PERSON_COLLECTION = "person_rollups"  # (name, month) counters
+LATE_AFTER = os.getenv("LATE_AFTER", "09:30:00")  # Check-ins after this time count as late
+COUNTERS = ("present", "absent", "late")
+
+
+# (collection, keys, options) of every index this module relies on
+INDEXES = [
+    (PERSON_COLLECTION, [("name", ASCENDING), ("month", ASCENDING)], {"unique": True}),
+]
+
+
+def ensure_indexes(db):
+    for collection, keys, options in INDEXES:
+        db[collection].create_index(keys, **options)
+
+
+def _changes(old_status, new_status, time):
+    inc = {}
+    if old_status in COUNTERS:
+        inc[old_status] = -1
+    if new_status in COUNTERS:
+        inc[new_status] = inc.get(new_status, 0) + 1
+    if new_status == "present" and time and time > LATE_AFTER:
+        inc["late"] = 1
+    update = {"$inc": inc}
+    if new_status == "present" and time:
+        update["$min"] = {"first_seen": time}
+    return update
+
+
+def change_updates(name, day, old_status, new_status, time=None):
+    """Return ``[(collection, filter, update)]`` for one attendance event change.
+
+    ``old_status`` is None for a new event.
+    """
+    update = _changes(old_status, new_status, time)
+    if not update["$inc"]:
+        return []
+    return [
+        (DAILY_COLLECTION, {"_id": day}, update),
+        (PERSON_COLLECTION, {"name": name, "month": day[:7]}, update),
+    ]
+
+
+def apply_change(db, name, day, old_status, new_status, time=None):
+    """Update the day and person counters after one attendance event changed."""
+    for collection, query, update in change_updates(name, day, old_status, new_status, time):
+        db[collection].update_one(query, update, upsert=True)
+
+
+def apply_changes(db, changes):
+    """Bulk form of apply_change for ``(name, day, old_status, new_status, time)`` tuples."""
+    operations = {}
+    for change in changes:
+        for collection, query, update in change_updates(*change):
+            operations.setdefault(collection, []).append(UpdateOne(query, update, upsert=True))
+    for collection, batch in operations.items():
+        db[collection].bulk_write(batch, ordered=False)
+
+
+def apply_absences(db, day, names):
+    """Count a batch of newly recorded absences (see attendance_events.close_out_day)."""
+    if not names:
+        return
+    db[DAILY_COLLECTION].update_one({"_id": day}, {"$inc": {"absent": len(names)}}, upsert=True)
+    db[PERSON_COLLECTION].bulk_write(
+        [UpdateOne({"name": name, "month": day[:7]}, {"$inc": {"absent": 1}}, upsert=True) for name in names],
+        ordered=False,
+    )
+
+
+def rebuild(db):
+    """Recompute all rollups from the events collection on the server."""
+    from attendance_events import EVENTS_COLLECTION
+
+    is_present = {"$eq": ["$status", "present"]}
+    counters = {
+        "present": {"$sum": {"$cond": [is_present, 1, 0]}},
+        "absent": {"$sum": {"$cond": [{"$eq": ["$status", "absent"]}, 1, 0]}},
+        "late": {"$sum": {"$cond": [{"$and": [is_present, {"$gt": ["$time", LATE_AFTER]}]}, 1, 0]}},
+        "first_seen": {"$min": {"$cond": [is_present, "$time", None]}},
+    }
+    events = db[EVENTS_COLLECTION]
+    db[DAILY_COLLECTION].delete_many({})
+    events.aggregate([
+        {"$group": {"_id": "$day", **counters}},
+        {"$merge": {"into": DAILY_COLLECTION, "whenMatched": "replace"}},
+    ])
+    db[PERSON_COLLECTION].delete_many({})
+    ensure_indexes(db)
+    events.aggregate([
+        {"$group": {"_id": {"name": "$name", "month": {"$substrCP": ["$day", 0, 7]}}, **counters}},
+        {"$project": {"_id": 0, "name": "$_id.name", "month": "$_id.month",
+                      "present": 1, "absent": 1, "late": 1, "first_seen": 1}},
+        {"$merge": {"into": PERSON_COLLECTION, "on": ["name", "month"], "whenMatched": "replace"}},
+    ])
+
+
+def _summarize(docs):
+    totals = dict.fromkeys(COUNTERS, 0)
+    first_seen = None
+    for doc in docs:
+        for counter in COUNTERS:
+            totals[counter] += doc.get(counter, 0)
+        if doc.get("first_seen") and (first_seen is None or doc["first_seen"] < first_seen):
+            first_seen = doc["first_seen"]
+    recorded = totals["present"] + totals["absent"]
+    totals["first_seen"] = first_seen
+    totals["attendance_rate"] = round(totals["present"] / recorded, 4) if recorded else None
+    return totals
+
+
+def daily_range(db, start, end):
+    """Per-day counters for ``start``..``end`` (YYYY-MM-DD, inclusive), one document per day."""
+    days = [
+        {"day": doc["_id"], **{counter: doc.get(counter, 0) for counter in COUNTERS}, "first_seen": doc.get("first_seen")}
+        for doc in db[DAILY_COLLECTION].find({"_id": {"$gte": start, "$lte": end}}).sort("_id", ASCENDING)
+    ]
+    return {"start": start, "end": end, "days": days, "totals": _summarize(days)}
+
+
+def person_range(db, name, start, end):
+    """Counters for one person over ``start``..``end`` (YYYY-MM-DD, inclusive).
+
+    Whole months come from the monthly rollups; the partial months at either
+    end are counted from that person's (name, day)-indexed events.
+    """
+    from attendance_events import EVENTS_COLLECTION
+
+    full_months = _full_months(start, end)
+    docs = list(db[PERSON_COLLECTION].find({"name": name, "month": {"$in": full_months}}))
+
+    edges = []
+    if full_months:
+        edges.append({"$gte": start, "$lt": full_months[0] + "-01"})
+        edges.append({"$gt": full_months[-1] + "-31", "$lte": end})
+    else:
+        edges.append({"$gte": start, "$lte": end})
+    for day_range in edges:
+        for event in db[EVENTS_COLLECTION].find({"name": name, "day": day_range}, {"_id": 0, "status": 1, "time": 1}):
+            status = event.get("status")
+            time = event.get("time") if status == "present" else None
+            docs.append({
+                "present": int(status == "present"),
+                "absent": int(status == "absent"),
+                "late": int(bool(time and time > LATE_AFTER)),
+                "first_seen": time,
+            })
+    return {"name": name, "start": start, "end": end, **_summarize(docs)}
+
+
+def _full_months(start, end):
+    """Months (YYYY-MM) lying entirely within ``start``..``end``."""
+    start_date = datetime.strptime(start, "%Y-%m-%d")
+    end_date = datetime.strptime(end, "%Y-%m-%d")
+    year, month = start_date.year, start_date.month
+    if start_date.day != 1:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    months = []
+    while (year, month) <= (end_date.year, end_date.month):
+        if (year, month) == (end_date.year, end_date.month) and end_date.day != calendar.monthrange(year, month)[1]:
+            break
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill":
+        print("Usage: python rollups.py backfill")
+        sys.exit(1)
+    import repository
+    rebuild(repository.get_db())
+    print("✅ Rollups rebuilt from attendance events.")
@@ -1,64 +1,48 @@
-from dotenv import load_dotenv
-import urllib
-import os
-load_dotenv()  # Ensure the environment variables are loaded first
+import sys
+from datetime import datetime
+import attendance_events
+import repository
+import rollups
 
-from pymongo import MongoClient
-from env import MONGO_CONNECTION_STRING
+# Shared lazy client, see repository.py
+mongo_url = repository.connection_string()
+db = repository.get_client()[repository.DB_NAME]  # No network traffic until first use
 
-load_dotenv()
-username = os.getenv("MONGO_USERNAME")
-password = os.getenv("MONGO_PASSWORD")  # Replace with your actual usernam
-encoded_password = urllib.parse.quote_plus(password)
-encoded_username = urllib.parse.quote_plus(username
+# Migrate the "attendance" collection to people + per-day attendance events
+def initialize_collections(drop_legacy=False):
+    attendance_collection = db[attendance_events.PEOPLE_COLLECTION]
 
-)
+    # Create indexes for faster queries, including the unique (name, day) event key
+    attendance_events.ensure_indexes(db)
 
-# Replace "password" in the connection string with the encoded one
-raw_url = os.getenv("MONGO_CONNECTION_STRING")
-mongo_url = raw_url.format(username=encoded_username, password=encoded_password)
+    # Ensure every person document has a phone field
+    attendance_collection.update_many({"phone": {"$exists": False}}, {"$set": {"phone": None}})
 
-# Define schema for the "attendance" collection
-def initialize_collections():
-    attendance_collection = db["attendance"]
+    # Copy the embedded attendance arrays into the events collection
+    written, skipped = attendance_events.backfill(db)
+    print(f"✅ Backfilled {written} attendance events ({skipped} unparseable entries skipped).")
 
-    # Create indexes for faster queries
-    attendance_collection.create_index("name", unique=True)
+    # Recompute the daily and per-person counters from the events
+    rollups.rebuild(db)
+    print("✅ Rebuilt attendance rollups.")
 
-    # Update existing documents to match the schema
-    for record in attendance_collection.find():
-        update_fields = {}
-        if "phone" not in record:
-            update_fields["phone"] = None  # Add a default phone field
-        if "attendance" not in record or not isinstance(record["attendance"], list):
-            update_fields["attendance"] = []  # Ensure attendance is a list
-        elif isinstance(record["attendance"], list):
-            # Ensure all entries in the attendance list are dictionaries with lat/long
-            update_fields["attendance"] = [
-                {
-                    **entry,
-                    "latitude": entry.get("latitude", None),
-                    "longitude": entry.get("longitude", None)
-                }
-                if isinstance(entry, dict) else {"date": entry, "status": "present", "latitude": None, "longitude": None}
-                for entry in record["attendance"]
-            ]
-        if update_fields:
-            attendance_collection.update_one({"_id": record["_id"]}, {"$set": update_fields})
+    if drop_legacy:
+        attendance_collection.update_many({"attendance": {"$exists": True}}, {"$unset": {"attendance": ""}})
+        print("🧹 Removed embedded attendance arrays.")
 
     print("✅ MongoDB schema initialized and updated.")
 
 # Function to add attendance entry
 def add_attendance_entry(name, phone, date, status, latitude=None, longitude=None):
-    attendance_collection = db["attendance"]
-    attendance_collection.update_one(
-        {"name": name},
-        {
-            "$set": {"phone": phone},
-            "$push": {"attendance": {"date": date, "status": status, "latitude": latitude, "longitude": longitude}}
-        },
-        upsert=True
+    """Record ``status`` for ``name`` on ``date``; returns False if already marked present."""
+    repository.register_person(name, phone)
+    when = attendance_events.parse_legacy_date(date) or datetime.now()
+    if status == "present":
+        return repository.mark_present(name, when, latitude=latitude, longitude=longitude)
+    repository.record_status(
+        name, when.strftime(attendance_events.DAY_FORMAT), status, latitude=latitude, longitude=longitude
     )
+    return True
 
 if __name__ == "__main__":
-    initialize_collections()
+    initialize_collections(drop_legacy="--drop-legacy" in sys.argv)
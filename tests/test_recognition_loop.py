@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+
+import frame_source
+import recognition_loop
+from face_index import FaceIndex
+from presence import PresenceCache
+from recognition_service import BrokenProcessPool
+
+
+class BrokenService:
+    """A RecognitionService whose pool died while idle: every submit raises."""
+
+    is_ready = True
+
+    def __init__(self):
+        self.submits = 0
+
+    def submit(self, frame, config=None):
+        self.submits += 1
+        raise BrokenProcessPool("A process in the process pool was terminated abruptly")
+
+
+class StaticCamera:
+    is_opened = True
+
+    def __init__(self):
+        self.seq = 0
+
+    def wait_for_frame(self, after_seq=None, timeout=1.0):
+        self.seq += 1
+        return self.seq, np.zeros((8, 8, 3), dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+class Events:
+    def publish(self, event):
+        pass
+
+
+def test_loop_survives_a_broken_pool(monkeypatch):
+    monkeypatch.setattr(frame_source, "acquire", lambda source: StaticCamera())
+    service = BrokenService()
+    seen = recognition_loop.SeenToday(presence=PresenceCache(db_fn=lambda: None))
+    loop = recognition_loop.RecognitionLoop(
+        {"door": 0}, service, FaceIndex(), lambda name, camera_id: ("success", ""), Events(), rate=50, seen=seen
+    )
+    assert loop.start()
+    try:
+        deadline = time.monotonic() + 2
+        while service.submits < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert service.submits >= 3
+        assert loop.is_running
+    finally:
+        loop.stop()
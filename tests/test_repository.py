@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+import repository
+from attendance_events import PEOPLE_COLLECTION
+from reports import report_page
+
+ROWS = [{"name": "Ann", "phone": "1", "time": "09:00:00", "status": "Present"}]
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __iter__(self):
+        return iter(self.documents)
+
+    def __next__(self):
+        return self.documents[0]
+
+    async def to_list(self, length):
+        return list(self.documents)
+
+
+class People:
+    """Records the pipelines it is given; answers like MongoDB would for ``ROWS``."""
+
+    def __init__(self, is_async):
+        self.is_async = is_async
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        if "$facet" in pipeline[-1]:
+            return Cursor([{"total": [{"count": len(ROWS)}], "rows": ROWS}])
+        return Cursor(ROWS)
+
+    def count_documents(self, query):
+        if not self.is_async:
+            return len(ROWS)
+
+        async def count():
+            return len(ROWS)
+
+        return count()
+
+
+class Database(dict):
+    def __init__(self, is_async):
+        super().__init__({PEOPLE_COLLECTION: People(is_async)})
+
+
+@pytest.mark.parametrize("sort", ["name", "status"])
+def test_async_report_page_runs_the_sync_query(sort, monkeypatch):
+    sync_db, async_db = Database(False), Database(True)
+    async_repository = repository.AsyncRepository()
+
+    async def ready_db():
+        return async_db
+
+    monkeypatch.setattr(async_repository, "_ready_db", ready_db)
+
+    expected = report_page(sync_db, "2026-10-18", 2, 10, sort, True)
+    assert asyncio.run(async_repository.report_page("2026-10-18", 2, 10, sort, True)) == expected == (ROWS, 1)
+    assert async_db[PEOPLE_COLLECTION].pipelines == sync_db[PEOPLE_COLLECTION].pipelines
@@ -0,0 +1,145 @@
+import itertools
+
+import cv2
+import numpy as np
+
+from detection import box_iou, detect_faces, encode_faces
+
+DEFAULT_DETECT_EVERY = 10  # Full detection every K frames
+MIN_TRACK_POINTS = 4
+LOST_CONFIDENCE = 0.3  # Below this a track is dropped and detection re-runs
+REENCODE_CONFIDENCE = 0.6  # Below this the identity is re-checked on the next detection
+
+_lk_params = dict(
+    winSize=(15, 15),
+    maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+)
+_track_ids = itertools.count(1)
+
+
+class Track:
+    """One face followed across frames, with the identity found when it was encoded."""
+
+    def __init__(self, box):
+        self.id = next(_track_ids)
+        self.box = box  # (top, right, bottom, left), same as face_recognition
+        self.name = None
+        self.distance = None
+        self.confidence = 1.0
+        self.needs_encoding = True
+        self.identified = False  # True only on the frame the identity was (re)assigned
+        self.points = None
+
+    @property
+    def label(self):
+        return self.name or "Stranger"
+
+
+class FaceTracker:
+    """Runs full face detection only every ``detect_every`` frames.
+
+    In between, faces are followed with pyramidal Lucas-Kanade optical flow
+    on a handful of corner points per face. Encoding and matching only run
+    for new tracks or tracks whose confidence dropped, and the identity is
+    carried along the track.
+    """
+
+    def __init__(self, face_index, detect_every=DEFAULT_DETECT_EVERY, config=None):
+        self.face_index = face_index
+        self.detect_every = detect_every
+        self.config = config
+        self.tracks = []
+        self._frames_since_detect = 0
+        self._prev_gray = None
+
+    def reset(self):
+        self.tracks = []
+        self._frames_since_detect = 0
+        self._prev_gray = None
+
+    def update(self, frame):
+        """Advance all tracks to ``frame`` (BGR) and return the live tracks."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        for track in self.tracks:
+            track.identified = False
+
+        lost = False
+        if self._prev_gray is not None and self.tracks:
+            lost = self._follow(gray)
+
+        if lost or not self.tracks or self._frames_since_detect >= self.detect_every:
+            self._redetect(frame, gray)
+            self._frames_since_detect = 0
+        else:
+            self._frames_since_detect += 1
+
+        self._prev_gray = gray
+        return self.tracks
+
+    def _follow(self, gray):
+        """Move every track by optical flow; return True if any was lost."""
+        lost = False
+        for track in self.tracks:
+            if track.points is None or len(track.points) < MIN_TRACK_POINTS:
+                track.confidence = 0.0
+                lost = True
+                continue
+
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, track.points, None, **_lk_params)
+            back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, new_points, None, **_lk_params)
+            # Forward-backward check: keep points that return to where they started
+            error = np.abs(track.points - back_points).reshape(-1, 2).max(axis=1)
+            good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < 1.0)
+
+            track.confidence = min(track.confidence, good.mean()) if len(good) else 0.0
+            if good.sum() < MIN_TRACK_POINTS or track.confidence < LOST_CONFIDENCE:
+                lost = True
+                continue
+
+            dx, dy = np.median((new_points - track.points).reshape(-1, 2)[good], axis=0)
+            top, right, bottom, left = track.box
+            track.box = (int(top + dy), int(right + dx), int(bottom + dy), int(left + dx))
+            track.points = new_points[good].reshape(-1, 1, 2)
+            if track.confidence < REENCODE_CONFIDENCE:
+                track.needs_encoding = True
+
+        self.tracks = [t for t in self.tracks if t.confidence >= LOST_CONFIDENCE]
+        return lost
+
+    def _redetect(self, frame, gray):
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        boxes = detect_faces(rgb_frame, self.config)
+
+        # Carry identities over to the detection that overlaps each track most
+        tracks = []
+        unmatched = list(self.tracks)
+        for box in boxes:
+            best = max(unmatched, key=lambda t: box_iou(t.box, box), default=None)
+            if best is not None and box_iou(best.box, box) > 0.3:
+                unmatched.remove(best)
+                track = best
+                track.box = box
+            else:
+                track = Track(box)
+            track.points = _track_points(gray, box)
+            track.confidence = 1.0
+            tracks.append(track)
+        self.tracks = tracks
+
+        pending = [t for t in tracks if t.needs_encoding]
+        if not pending:
+            return
+        encodings = encode_faces(rgb_frame, [t.box for t in pending])
+        for track, (name, distance) in zip(pending, self.face_index.match(encodings)):
+            track.identified = track.name != name or track.distance is None
+            track.name, track.distance = name, distance
+            track.needs_encoding = False
+
+
+def _track_points(gray, box):
+    top, right, bottom, left = box
+    mask = np.zeros_like(gray)
+    mask[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)] = 255
+    return cv2.goodFeaturesToTrack(gray, maxCorners=30, qualityLevel=0.01, minDistance=5, mask=mask)
+
@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class Warmup:
+    """Runs slow start-up steps on a background thread and reports on them.
+
+    Steps run in the order they were added; a failing step is recorded and
+    the next one still runs. ``status()`` is what /ready serves, so a
+    process can answer HTTP straight away and report when it is usable.
+    """
+
+    def __init__(self):
+        self._steps = []
+        self._state = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+
+    def add(self, name, fn, required=True):
+        """Register ``fn`` as step ``name``; optional steps do not hold back ``is_ready``."""
+        self._steps.append((name, fn, required))
+        self._state[name] = {"status": "pending", "required": required}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def is_ready(self, name=None):
+        with self._lock:
+            if name is not None:
+                return self._state[name]["status"] == "ready"
+            return all(state["status"] == "ready" for state in self._state.values() if state["required"])
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def status(self):
+        with self._lock:
+            return {name: dict(state) for name, state in self._state.items()}
+
+    def _set(self, name, **state):
+        with self._lock:
+            self._state[name].update(state)
+
+    def _run(self):
+        for name, fn, _ in self._steps:
+            self._set(name, status="warming")
+            started = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ Start-up step {name} failed: {e}")
+                self._set(name, status="failed", error=str(e))
+            else:
+                self._set(name, status="ready")
+            self._set(name, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+        self._done.set()
@@ -1,61 +1,144 @@
 from flask import Flask, render_template, request, jsonify, Response, redirect, url_for
 import cv2
-import face_recognition_models
-import face_recognition
 import os
-import pickle
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
 from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
 from datetime import datetime
 import datetime as dt  # Ensure correct import of datetime module
+import attendance_events
+import enrolment
+import reports as attendance_reports
+import repository
+from checkin_queue import CheckinQueue
+from presence import PresenceCache
+from face_index import FaceIndex
+from face_store import FaceStore
+import frame_source
+import metrics
+import mjpeg
+from warmup import Warmup
+from detection import config_for
+from recognition_service import BrokenProcessPool, RecognitionService, TimeoutError
+from recognition_loop import EventBus, RecognitionLoop, SeenToday
+import atexit
+import threading
+import time
 
 # Load environment variables
 selected_camera_url = 0  # Default to webcam (OpenCV index 0)
-camera = None
+camera = None  # frame_source.CaptureWorker for the selected camera
+camera_lock = threading.Lock()
+FRAME_TIMEOUT = 2.0  # Seconds to wait for a first frame from a fresh camera
 
 load_dotenv()
-MONGO_CONNECTION_STRING = os.getenv("MONGO_STRING")
+
+# /video_feed stream settings, shared by all viewers of a camera
+MJPEG_QUALITY = int(os.getenv("MJPEG_QUALITY", mjpeg.DEFAULT_QUALITY))
+MJPEG_MAX_WIDTH = int(os.getenv("MJPEG_MAX_WIDTH", 0)) or None
+MJPEG_MAX_FPS = float(os.getenv("MJPEG_MAX_FPS", 0)) or None
+
+# Hands-free recognition settings
+RECOGNITION_FPS = float(os.getenv("RECOGNITION_FPS", 2))
+
+def parse_source(source):
+    """Webcam indexes arrive as strings from forms and env vars."""
+    return int(source) if str(source).isdigit() else source
+
+# Cameras for multi-entrance mode, e.g. CAMERAS="front=0,back=rtsp://10.0.0.5/stream"
+registered_cameras = {
+    camera_id.strip(): parse_source(source.strip())
+    for camera_id, _, source in (entry.partition("=") for entry in os.getenv("CAMERAS", "").split(",") if entry.strip())
+}
+
+def camera_id_for(source):
+    """Return the registered ID of ``source``, or the source itself as an ID."""
+    for camera_id, registered_source in registered_cameras.items():
+        if registered_source == source:
+            return camera_id
+    return str(source)
+
+# Detection and encoding run on a process pool, off the request threads
+RECOGNITION_WORKERS = int(os.getenv("RECOGNITION_WORKERS", 0)) or None
+RECOGNITION_TIMEOUT = float(os.getenv("RECOGNITION_TIMEOUT", 10))
 
 app = Flask(__name__)
 
 # File paths
-FACE_DATA_FILE = "faces.pkl"
+FACE_STORE_PATH = "faces"  # faces.f32 + faces.names, see face_store.py
 FACES_DIR = "faces"
 os.makedirs(FACES_DIR, exist_ok=True)
-
-# MongoDB connection setup
-try:
-    client = MongoClient(MONGO_CONNECTION_STRING, serverSelectionTimeoutMS=5000)
-    db = client["attendanceDB"]
-    attendance_collection = db["attendance"]
-    client.server_info()  # Test the connection
-    print("✅ Connected to MongoDB Atlas successfully.")
-except ServerSelectionTimeoutError as e:
-    print(f"❌ Error connecting to MongoDB Atlas: {e}")
-    attendance_collection = None
-
-# Load stored face data
-known_face_encodings = []
-known_face_names = []
-if os.path.exists(FACE_DATA_FILE):
-    with open(FACE_DATA_FILE, "rb") as f:
-        known_face_encodings, known_face_names = pickle.load(f)
-
-# Initialize webcam
-camera = cv2.VideoCapture(0)
-if not camera.isOpened():
-    print("❌ Failed to initialize the webcam.")
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+recognition_service = RecognitionService(RECOGNITION_WORKERS)
+atexit.register(recognition_service.shutdown)  # Unlinks the shared-memory frame buffers
+
+# MongoDB is reached through repository.py: one lazily created, pooled client per process.
+# Check-ins go to a local queue first and are replayed into MongoDB in the background;
+# people already marked today are answered from the in-memory presence cache.
+presence = PresenceCache()
+report_cache = attendance_reports.ReportCache(ttl=float(os.getenv("REPORT_CACHE_TTL", 5)))
+checkin_queue = CheckinQueue(on_flush=lambda marked: report_cache.invalidate(), presence=presence)
+
+face_store = FaceStore(FACE_STORE_PATH)
+face_index = FaceIndex()
+
+def connect_database():
+    presence.start()
+    checkin_queue.start()
+    repository.get_db()  # Connects and ensures indexes; check-ins are queued locally meanwhile
+
+# Nothing slow happens at import, so the server answers at once and /ready reports progress.
+# The recognition workers fork first, before the database threads exist; the camera opens on first use.
+warmup = Warmup()
+warmup.add("recognition", recognition_service.start)
+warmup.add("gallery", lambda: face_store.sync(face_index))
+warmup.add("database", connect_database, required=False)  # The app keeps working offline
+warmup.start()
+STARTING_MESSAGE = "Face recognition is still starting. Please try again in a moment."
+RESTARTING_MESSAGE = "Face recognition is restarting. Please try again in a moment."
+
+# Camera handling: every route shares one capture worker per source
+def get_camera():
+    """Return the capture worker for the selected camera, starting it if needed."""
+    global camera
+    with camera_lock:
+        if camera is None or not camera.is_opened:
+            if camera is not None:
+                camera.release()
+            camera = frame_source.acquire(selected_camera_url)
+        return camera
+
+def release_camera():
+    """Drop the app's reference; open /video_feed streams keep their own."""
+    global camera
+    with camera_lock:
+        if camera is not None:
+            camera.release()
+            camera = None
+
+def read_frame():
+    """Return the newest frame from the selected camera, or None."""
+    with metrics.timed("capture_read"):
+        worker = get_camera()
+        if worker is None:
+            return None
+        frame = worker.latest()
+        if frame is None:
+            _, frame = worker.wait_for_frame(timeout=FRAME_TIMEOUT)
+        return frame
+
+@app.errorhandler(PyMongoError)
+def database_unavailable(e):
+    return jsonify({"status": "error", "message": "The attendance database is unreachable. Please try again later."}), 503
 
 @app.route("/")
 def home():
-    if camera.isOpened():
-        camera.release()
+    release_camera()
     return render_template("home.html")
 
 @app.route("/select_camera", methods=["POST"])
 def select_camera():
-    global selected_camera_url, camera
+    global selected_camera_url
 
     cam_type = request.form.get("camera_type")
     rtsp_url = request.form.get("rtsp_url")
@@ -67,40 +150,50 @@ def select_camera():
     else:
         return "Invalid camera selection", 400
 
-    if camera and camera.isOpened():
-        camera.release()
-    camera = cv2.VideoCapture(selected_camera_url)
-
-    if not camera.isOpened():
+    release_camera()
+    if get_camera() is None:
         return "Failed to initialize selected camera", 500
 
     return redirect(url_for("register"))
 
 @app.route("/video_feed")
 def video_feed():
-    global camera
-    if camera is None or not camera.isOpened():
-        camera = cv2.VideoCapture(selected_camera_url)
-
-    def generate_frames():
-        while True:
-            success, frame = camera.read()
-            if not success:
-                break
-            _, buffer = cv2.imencode(".jpg", frame)
-            frame = buffer.tobytes()
-            yield (b"--frame\r\n"
-                   b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
-        camera.release()
-
-    return Response(generate_frames(), mimetype="multipart/x-mixed-replace; boundary=frame")
+    # ?camera=<id> streams one of the registered cameras instead of the selected one
+    source = registered_cameras.get(request.args.get("camera"), selected_camera_url)
+    broadcaster = mjpeg.subscribe(source, MJPEG_QUALITY, MJPEG_MAX_WIDTH)
+    if broadcaster is None:
+        return "Failed to initialize selected camera", 500
+
+    # Viewers may ask for a lower rate than the server-wide cap, e.g. ?fps=5
+    max_fps = request.args.get("fps", type=float) or MJPEG_MAX_FPS
+    if MJPEG_MAX_FPS:
+        max_fps = min(max_fps, MJPEG_MAX_FPS)
+
+    return Response(broadcaster.frames(max_fps), mimetype="multipart/x-mixed-replace; boundary=frame")
+
+def read_burst(count=enrolment.BURST_FRAMES, interval=enrolment.BURST_INTERVAL):
+    """Return up to ``count`` frames from the selected camera, ``interval`` seconds apart."""
+    worker = get_camera()
+    frames, seq = [], None
+    while worker is not None and len(frames) < count:
+        if frames:
+            time.sleep(interval)
+        seq, frame = worker.wait_for_frame(seq, timeout=FRAME_TIMEOUT)
+        if frame is None:
+            break
+        frames.append(frame)
+    return frames
+
+def enroll_faces(name, frame, face_encodings):
+    """Store a person's face samples and their photo."""
+    face_store.append_many(face_encodings, [name] * len(face_encodings))
+    face_store.sync(face_index)
+    cv2.imwrite(os.path.join(FACES_DIR, f"{name}.jpg"), frame)
 
 @app.route("/register", methods=["GET", "POST"])
 def register():
-    global camera
     if request.method == "GET":
-        if camera is None or not camera.isOpened():
-            camera = cv2.VideoCapture(selected_camera_url)
+        get_camera()
         return render_template("register.html")
 
     try:
@@ -109,142 +202,338 @@ def register():
 
         if not name or not phone:
             return jsonify({"status": "error", "message": "Name and phone are required."}), 400
+        if not recognition_service.is_ready:
+            return jsonify({"status": "error", "message": STARTING_MESSAGE}), 503
 
-        success, frame = camera.read()
-        if not success:
+        # Several frames, so one bad frame (blur, pose, lighting) does not decide enrolment
+        frames = read_burst()
+        if not frames:
             return jsonify({"status": "error", "message": "Failed to access webcam."}), 500
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        if not face_locations:
-            return jsonify({"status": "error", "message": "No face detected. Please try again."}), 400
-
-        face_encoding = face_recognition.face_encodings(rgb_frame, face_locations)[0]
-        known_face_encodings.append(face_encoding)
-        known_face_names.append(name)
-
-        with open(FACE_DATA_FILE, "wb") as f:
-            pickle.dump((known_face_encodings, known_face_names), f)
-
-        cv2.imwrite(os.path.join(FACES_DIR, f"{name}.jpg"), frame)
-
-        now = datetime.now()
-        date = now.strftime("%d-%m-%Y %H:%M:%S")
-        record = attendance_collection.find_one({"name": name})
-        if record:
-            attendance_collection.update_one(
-                {"name": name},
-                {
-                    "$set": {"phone": phone},
-                    "$push": {"attendance": {"date": date, "status": "registered"}}
-                }
-            )
-        else:
-            attendance_collection.insert_one({
-                "name": name,
-                "phone": phone,
-                "attendance": [{"date": date, "status": "registered"}]
-            })
+        config = config_for(selected_camera_url)
+        deadline = time.monotonic() + RECOGNITION_TIMEOUT
+        try:
+            futures = [recognition_service.submit(frame, config) for frame in frames]
+            results = [future.result(timeout=max(deadline - time.monotonic(), 0)) for future in futures]
+        except TimeoutError:
+            return jsonify({"status": "error", "message": "Face recognition timed out. Please try again."}), 503
+        except BrokenProcessPool:
+            return jsonify({"status": "error", "message": RESTARTING_MESSAGE}), 503
+
+        face_encodings, photo, reason = enrolment.pick_samples(frames, results)
+        if not face_encodings:
+            return jsonify({"status": "error", "message": reason}), 400
+
+        enroll_faces(name, photo, face_encodings)
+        repository.register_person(name, phone, camera_id=camera_id_for(selected_camera_url))
+        report_cache.invalidate()
 
         return jsonify({"status": "success", "message": f"{name} registered successfully!"})
     except Exception as e:
         return jsonify({"status": "error", "message": "An internal error occurred."}), 500
 
+# Bulk enrolment runs one job at a time in the background; GET /enrol reports on it
+enrolment_lock = threading.Lock()
+enrolment_status = {"state": "idle"}
+
+def run_enrolment(source, images_dir=None):
+    """Enrol everyone in a folder or .xlsx roster on the recognition workers."""
+    global enrolment_status
+    try:
+        roster = enrolment.load_roster(source, images_dir)
+        summary = enrolment.enrol(roster, face_store, recognition_service, repository.get_db(),
+                                  camera_id="bulk")
+        face_store.sync(face_index)
+        report_cache.invalidate()
+        enrolment_status = {"state": "done", "source": source, **summary}
+    except Exception as e:
+        enrolment_status = {"state": "failed", "source": source, "message": str(e)}
+    finally:
+        enrolment_lock.release()
+
+def is_inside(path, directory):
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([os.path.realpath(path), directory]) == directory
+
+def start_enrolment(source, images_dir=None):
+    """Start a bulk enrolment job; returns (status, message, http_status)."""
+    global enrolment_status
+    source = source or FACES_DIR
+    # /enrol is unauthenticated, so it may only read the photo folder or a roster shipped with the app
+    if os.path.realpath(source) == os.path.realpath(FACES_DIR):
+        source = FACES_DIR
+    elif source.lower().endswith(".xlsx") and is_inside(source, APP_DIR):
+        if not os.path.isfile(source):
+            return "error", f"{source} not found.", 400
+    else:
+        return "error", f"Enrolment can only read {FACES_DIR}/ or a .xlsx roster in the app folder.", 400
+    if images_dir and not (os.path.isdir(images_dir) and is_inside(images_dir, APP_DIR)):
+        return "error", "The images folder must be inside the app folder.", 400
+    if not enrolment_lock.acquire(blocking=False):
+        return "info", "An enrolment is already running.", 409
+    enrolment_status = {"state": "running", "source": source}
+    threading.Thread(target=run_enrolment, args=(source, images_dir), name="enrolment", daemon=True).start()
+    return "success", f"Enrolling from {source}.", 202
+
+@app.route("/enrol", methods=["GET", "POST"])
+def enrol():
+    if request.method == "GET":
+        return jsonify(enrolment_status)
+    status, message, code = start_enrolment(request.form.get("source"), request.form.get("images"))
+    return jsonify({"status": status, "message": message}), code
+
+def mark_present(name, camera_id=None):
+    """Mark ``name`` present for today; return a (status, message) pair."""
+    now = dt.datetime.now()
+    if not checkin_queue.mark_present(name, now, camera_id=camera_id):
+        return "info", f"Attendance already marked for {name} today."
+    return "success", f"✅ Attendance marked for {name} at {now.strftime('%H:%M:%S')}."
+
 @app.route("/mark_attendance", methods=["GET", "POST"])
 def mark_attendance():
-    global camera
     if request.method == "GET":
-        if camera is None or not camera.isOpened():
-            camera = cv2.VideoCapture(selected_camera_url)
-        return render_template("mark_attendance.html")
-
-    success, frame = camera.read()
-    if not success:
+        get_camera()
+        return render_template("mark_attendance.html", hands_free=recognition_loop is not None)
+    with metrics.timed("mark_attendance"):
+        return recognize_and_mark()
+
+def recognize_and_mark():
+    if not recognition_service.is_ready:
+        return jsonify({"status": "error", "message": STARTING_MESSAGE}), 503
+    frame = read_frame()
+    if frame is None:
         return jsonify({"status": "error", "message": "Failed to access webcam."}), 500
 
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    face_locations = face_recognition.face_locations(rgb_frame)
-    face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-    for face_encoding in face_encodings:
-        matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-        name = "Stranger"
-        if True in matches:
-            idx = matches.index(True)
-            name = known_face_names[idx]
-
-            now = dt.datetime.now()
-            today_date = now.strftime("%d-%m-%Y")
-            current_time = now.strftime("%H:%M:%S")
-            record = attendance_collection.find_one({"name": name})
-            if record:
-                attendance_today = any(
-                    entry.get("date") == today_date for entry in record.get("attendance", [])
-                )
-                if attendance_today:
-                    return jsonify({"status": "info", "message": f"Attendance already marked for {name} today."})
-
-            attendance_entry = {"date": today_date, "time": current_time, "status": "present"}
-            attendance_collection.update_one(
-                {"name": name},
-                {"$push": {"attendance": attendance_entry}},
-                upsert=True
-            )
-            return jsonify({"status": "success", "message": f"✅ Attendance marked for {name} at {current_time}."})
+    try:
+        face_locations, face_encodings = recognition_service.recognize(
+            frame, config_for(selected_camera_url), timeout=RECOGNITION_TIMEOUT
+        )
+    except TimeoutError:
+        return jsonify({"status": "error", "message": "Face recognition timed out. Please try again."}), 503
+    except BrokenProcessPool:
+        return jsonify({"status": "error", "message": RESTARTING_MESSAGE}), 503
+
+    # Pick up faces enrolled by other workers since the last request
+    with metrics.timed("face_store_sync"):
+        face_store.sync(face_index)
+    with metrics.timed("match"):
+        matches = face_index.match(face_encodings)
+    for name, distance in matches:
+        if name is not None:
+            status, message = mark_present(name, camera_id_for(selected_camera_url))
+            return jsonify({"status": status, "message": message})
 
     return jsonify({"status": "error", "message": "No recognized faces found."})
 
+# Hands-free mode: recognize everyone passing the camera and push results over SSE
+recognition_events = EventBus()
+seen_today = SeenToday(presence=presence)
+recognition_loop = None
+
+def start_hands_free():
+    """Start the recognition loop; returns (status, message, http_status)."""
+    global recognition_loop
+    if recognition_loop is not None and recognition_loop.is_running:
+        return "info", "Hands-free recognition is already running.", 200
+
+    # Every registered entrance camera, or just the selected one
+    cameras = registered_cameras or {camera_id_for(selected_camera_url): selected_camera_url}
+    recognition_loop = RecognitionLoop(
+        cameras, recognition_service, face_index, mark_present, recognition_events,
+        face_store=face_store, rate=RECOGNITION_FPS, seen=seen_today
+    )
+    if not recognition_loop.start():
+        recognition_loop = None
+        return "error", "Failed to access webcam.", 500
+    return "success", "Hands-free recognition started.", 200
+
+def stop_hands_free():
+    global recognition_loop
+    if recognition_loop is not None:
+        recognition_loop.stop()
+        recognition_loop = None
+
+@app.route("/recognition/start", methods=["POST"])
+def start_recognition():
+    status, message, code = start_hands_free()
+    return jsonify({"status": status, "message": message}), code
+
+@app.route("/recognition/stop", methods=["POST"])
+def stop_recognition():
+    stop_hands_free()
+    return jsonify({"status": "success", "message": "Hands-free recognition stopped."})
+
+def add_camera(camera_id, source):
+    """Register an entrance camera; returns (status, message, http_status)."""
+    if not camera_id or not source:
+        return "error", "camera_id and source are required.", 400
+    registered_cameras[camera_id] = parse_source(source)
+    if recognition_loop is not None and recognition_loop.is_running:
+        if not recognition_loop.add_camera(camera_id, registered_cameras[camera_id]):
+            return "error", f"Failed to open camera {camera_id}.", 500
+    return "success", f"Camera {camera_id} registered.", 200
+
+def drop_camera(camera_id):
+    """Unregister an entrance camera; returns (status, message, http_status)."""
+    if registered_cameras.pop(camera_id, None) is None:
+        return "error", f"Unknown camera {camera_id}.", 404
+    if recognition_loop is not None:
+        recognition_loop.remove_camera(camera_id)
+    return "success", f"Camera {camera_id} removed.", 200
+
+@app.route("/cameras", methods=["GET", "POST"])
+def cameras():
+    if request.method == "GET":
+        return jsonify({camera_id: str(source) for camera_id, source in registered_cameras.items()})
+
+    status, message, code = add_camera(request.form.get("camera_id"), request.form.get("source"))
+    return jsonify({"status": status, "message": message}), code
+
+@app.route("/cameras/stats")
+def camera_stats():
+    """Frame counts, drops, reconnects and frame age of every open capture."""
+    return jsonify(frame_source.stats())
+
+@app.route("/cameras/<camera_id>", methods=["DELETE"])
+def remove_camera(camera_id):
+    status, message, code = drop_camera(camera_id)
+    return jsonify({"status": status, "message": message}), code
+
+@app.route("/recognition/events")
+def recognition_event_stream():
+    return Response(recognition_events.stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
+
 @app.route("/mark_absentees", methods=["POST"])
 def mark_absentees():
-    now = datetime.now()
-    today_date = now.strftime("%Y-%m-%d")
-
-    all_users = attendance_collection.find()
-    for user in all_users:
-        name = user.get("name", "Unknown")
-        attendance = user.get("attendance", [])
-
-        attendance_today = any(entry.get("date") == today_date for entry in attendance)
-        if not attendance_today:
-            attendance_collection.update_one(
-                {"name": name},
-                {"$push": {"attendance": {"date": today_date, "status": "absent"}}}
-            )
-    return jsonify({"status": "success", "message": "Absentees marked successfully."})
+    summary = repository.close_out_day()
+    report_cache.invalidate()
+    return jsonify({
+        "status": "success",
+        "message": f"Absentees marked successfully: {summary['absent_marked']} of {summary['people']} people "
+                   f"in {summary['elapsed_ms']} ms.",
+        **summary,
+    })
+
+def report_day(args):
+    """Day requested with ?date=YYYY-MM-DD, defaulting to today."""
+    day = args.get("date")
+    try:
+        return datetime.strptime(day, attendance_events.DAY_FORMAT)
+    except (TypeError, ValueError):
+        return datetime.now()
+
+def report_params(args):
+    """Return (day, page, per_page, sort, descending) from the /reports query string."""
+    day = report_day(args).strftime(attendance_events.DAY_FORMAT)
+    page = max(args.get("page", 1, type=int), 1)
+    per_page = min(max(args.get("per_page", attendance_reports.DEFAULT_PER_PAGE, type=int), 1),
+                   attendance_reports.MAX_PER_PAGE)
+    sort = args.get("sort", "name")
+    if sort not in attendance_reports.SORT_FIELDS:
+        sort = "name"
+    return day, page, per_page, sort, args.get("order") == "desc"
+
+def report_context(params, rows, total):
+    """Template variables for one rendered /reports page."""
+    day, page, per_page, sort, descending = params
+    today_date = datetime.strptime(day, attendance_events.DAY_FORMAT).strftime("%d-%m-%Y")
+    report_data = [
+        {
+            "name": row.get("name", "Unknown"),
+            "phone": row.get("phone", "Unknown"),
+            "status": row["status"],
+            "date": today_date,
+            "time": row.get("time") or "N/A",
+        }
+        for row in rows
+    ]
+    pages = max((total + per_page - 1) // per_page, 1)
+    return dict(
+        report_data=report_data, error=None, day=day, page=page, pages=pages,
+        per_page=per_page, sort=sort, order="desc" if descending else "asc", total=total
+    )
 
 @app.route("/reports")
 def reports():
-    if camera.isOpened():
-        camera.release()
-
-    now = dt.datetime.now()
-    today_date = now.strftime("%d-%m-%Y")
-
-    all_users = attendance_collection.find()
-    report_data = []
-    for user in all_users:
-        name = user.get("name", "Unknown")
-        phone = user.get("phone", "Unknown")
-        attendance = user.get("attendance", [])
-        attendance_today = next(
-            (entry for entry in attendance if entry.get("date") == today_date and entry.get("status") == "present"), None
-        )
-        if attendance_today:
-            status = "Present"
-            time = attendance_today.get("time", "N/A")
-        else:
-            status = "Absent"
-            time = "N/A"
-
-        report_data.append({
-            "name": name,
-            "phone": phone,
-            "status": status,
-            "date": today_date,
-            "time": time
-        })
+    release_camera()
+
+    params = report_params(request.args)
+    cached = report_cache.get(params)
+    if cached is None:
+        cached = repository.report_page(*params)
+        report_cache.put(params, cached)
+    return render_template("reports.html", **report_context(params, *cached))
+
+@app.route("/reports/export")
+def export_report():
+    day = report_day(request.args).strftime(attendance_events.DAY_FORMAT)
+    rows = repository.iter_report(day)
+    if request.args.get("format") == "json":
+        return Response(attendance_reports.export_json(rows), mimetype="application/json")
+    return Response(
+        attendance_reports.export_csv(rows), mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=attendance-{day}.csv"}
+    )
+
+def analytics_range(args):
+    """Return (start, end) from ?start=&end= (YYYY-MM-DD), defaulting to the last 30 days."""
+    end = args.get("end") or datetime.now().strftime(attendance_events.DAY_FORMAT)
+    start = args.get("start") or (
+        datetime.strptime(end, attendance_events.DAY_FORMAT) - dt.timedelta(days=29)
+    ).strftime(attendance_events.DAY_FORMAT)
+    return start, end
+
+@app.route("/analytics/daily")
+def daily_analytics():
+    try:
+        start, end = analytics_range(request.args)
+        return jsonify(repository.daily_range(start, end))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Dates must be YYYY-MM-DD."}), 400
 
-    return render_template("reports.html", report_data=report_data, error=None)
+@app.route("/analytics/person/<name>")
+def person_analytics(name):
+    try:
+        start, end = analytics_range(request.args)
+        return jsonify(repository.person_range(name, start, end))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Dates must be YYYY-MM-DD."}), 400
+
+def readiness():
+    """Return (body, http_status) for /ready: 200 once recognition and the face gallery are warm."""
+    subsystems = warmup.status()
+    subsystems["presence"] = {"status": "ready" if presence.is_warm else "warming", "required": False}
+    # Opened on first use by a page or stream, not at start-up
+    subsystems["camera"] = {"status": "open" if camera is not None and camera.is_opened else "closed",
+                            "required": False}
+    is_ready = warmup.is_ready()
+    return {"ready": is_ready, "subsystems": subsystems}, 200 if is_ready else 503
+
+@app.route("/ready")
+def ready():
+    body, code = readiness()
+    return jsonify(body), code
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route("/metrics/profiler", methods=["GET", "POST"])
+def profiler():
+    """GET: collapsed stacks sampled so far. POST action=start|stop|reset (and interval=seconds)."""
+    if request.method == "GET":
+        return Response(metrics.profiler.collapsed(), mimetype="text/plain")
+    action = request.form.get("action")
+    if action == "start":
+        metrics.profiler.start(request.form.get("interval", type=float))
+    elif action == "stop":
+        metrics.profiler.stop()
+    elif action == "reset":
+        metrics.profiler.reset()
+    else:
+        return jsonify({"status": "error", "message": "action must be start, stop or reset."}), 400
+    return jsonify({"status": "success", "running": metrics.profiler.is_running})
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)